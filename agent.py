@@ -4,148 +4,349 @@ import time
 import threading
 from queue import Queue
 from pathlib import Path
+from typing import Optional
 
 from config import Config
+from capture import FrameSnapshot, parse_camera_source
 from logger import logger
-from utils import load_known_faces, init_item_db
-from update_visitors import update_visitors
+from utils import load_gallery, init_item_db, StageTimer
+from update_visitors import PresenceTracker, VisitorLogWriter
+from item_writer import ItemWriter
+from database import ItemDatabase
+from gallery import GalleryWatcher
+from gallery_index import load_indexed_gallery
+from pipeline import CameraPipeline
+from inference_pool import FaceInferencePool
+from unknowns import UnknownStoreSaver, build_unknown_store
 
 # Import Speech Modules
 from speech.listener import speech_listener
 from speech.handler import handle_speech_input
 
 # Import Models
-from models.insightface_model import face_model, recognize_face, draw_box
+from models.insightface_model import benchmark_face_model
 
 class VideoAgent:
     def __init__(self):
         logger.info("Initializing Video Agent...")
-        
+
         # Ensure directories and files exist
         Config.ensure_directories()
-        if not Config.VISITOR_LOG_PATH.exists():
-            Config.VISITOR_LOG_PATH.touch()
 
         # Load Data
-        self.known_faces = load_known_faces(Config.EMBEDDINGS_DIR)
+        self.gallery = load_gallery(Config.EMBEDDINGS_DIR)
+        self.gallery_watcher = GalleryWatcher(
+            Config.EMBEDDINGS_DIR, self._on_gallery_reload, Config.GALLERY_RELOAD_SEC,
+            loader=load_indexed_gallery
+        ) if Config.GALLERY_HOT_RELOAD else None
+        self.unknown_store = build_unknown_store()
+        self.unknown_store_saver = UnknownStoreSaver(
+            self.unknown_store, Config.UNKNOWN_STORE_PATH, Config.UNKNOWN_SAVE_SEC
+        ) if self.unknown_store is not None else None
         init_item_db()
-        
+        if Config.FACE_BENCHMARK_ON_STARTUP:
+            benchmark_face_model()
+
         # Initialize State
-        self.active_visitors = {}
         self.running = False
-        
+        self.stop_event = threading.Event()
+        self.timer = StageTimer()
+        self.started_at = None
+
+        # Visitor sessions are shared by all cameras (a person seen by two
+        # doors is a single visitor) and written to the visitor history
+        # database by a background thread, off the video threads.
+        self.visitor_log_writer = VisitorLogWriter(
+            Config.VISITOR_DB_PATH,
+            queue_size=Config.VISITOR_LOG_QUEUE_SIZE,
+            batch_size=Config.VISITOR_LOG_BATCH_SIZE,
+            batch_sec=Config.VISITOR_LOG_BATCH_SEC,
+            fsync=Config.VISITOR_LOG_FSYNC,
+            fsync_sec=Config.VISITOR_LOG_FSYNC_SEC,
+        )
+        try:
+            self.visitor_log_writer.history.import_jsonl(Config.VISITOR_LOG_PATH)
+        except Exception as e:
+            logger.error(f"Failed to import legacy visitor log: {e}")
+        self.presence = PresenceTracker(
+            Config.VISITOR_GRACE_PERIOD_SEC, self.visitor_log_writer.log_session
+        )
+
+        # Stored items (image + row) are persisted off the speech handler's request path
+        self.item_writer = ItemWriter(
+            ItemDatabase(Config.DB_PATH),
+            queue_size=Config.ITEM_WRITE_QUEUE_SIZE,
+            batch_size=Config.ITEM_WRITE_BATCH_SIZE,
+            batch_sec=Config.ITEM_WRITE_BATCH_SEC,
+        )
+
+        # One capture + inference pipeline per video source, sharing the gallery
+        self.pipelines = [
+            CameraPipeline(
+                i, parse_camera_source(source), lambda: self.gallery, self._on_detections, self.timer,
+                self.unknown_store
+            )
+            for i, source in enumerate(Config.CAMERA_SOURCES)
+        ]
+
+        # Optional multi-process inference (replaces the in-thread pipelines)
+        self.inference_pool = FaceInferencePool(
+            Config.INFERENCE_WORKERS,
+            self.gallery,
+            Config.FACE_RECOG_THRESHOLD,
+            Config.FACE_RECOG_TOP_K,
+            gallery_dir=Config.EMBEDDINGS_DIR,
+        ) if Config.INFERENCE_WORKERS > 0 else None
+
         # Queues and Events
         self.audio_queue = Queue()
-        self.frame_request_queue = Queue()
-        self.frame_response_queue = Queue()
         self.pause_listener_event = threading.Event()
-        
+
         # Threads
         self.listener_thread = threading.Thread(
-            target=speech_listener, 
-            args=(self.audio_queue, self.pause_listener_event), 
+            target=speech_listener,
+            args=(self.audio_queue, self.pause_listener_event),
             daemon=True,
             name="SpeechListener"
         )
         self.handler_thread = threading.Thread(
             target=handle_speech_input,
             args=(
-                self.audio_queue, 
-                self.pause_listener_event, 
-                self.frame_request_queue, 
-                self.frame_response_queue
+                self.audio_queue,
+                self.pause_listener_event,
+                self.frame_snapshot,
+                self.item_writer,
+                self.presence.open_sessions
             ),
             daemon=True,
             name="SpeechHandler"
         )
+        self.pool_thread = threading.Thread(
+            target=self.pool_inference_loop,
+            daemon=True,
+            name="FaceInferencePool"
+        ) if self.inference_pool is not None else None
 
     def start(self):
         """
         Starts the agent's threads and main video loop.
         """
         logger.info("Starting Video Agent threads...")
-        self.listener_thread.start()
-        self.handler_thread.start()
-        
-        self.display_loop()
+        if Config.SPEECH_ENABLED:
+            self.item_writer.start()
+            self.listener_thread.start()
+            self.handler_thread.start()
+
+        if Config.HEADLESS:
+            self.headless_loop()
+        else:
+            self.display_loop()
+
+    def frame_snapshot(self) -> Optional[FrameSnapshot]:
+        """Snapshot of the primary camera, which serves frame captures for tools."""
+        return self.pipelines[0].snapshot if self.pipelines else None
+
+    def start_pipelines(self) -> bool:
+        """
+        Opens every camera and starts inference. Sources that fail to open
+        are dropped; returns False if none could be opened.
+        """
+        self.pipelines = [p for p in self.pipelines if p.start_capture()]
+        if not self.pipelines:
+            return False
+
+        self.started_at = time.perf_counter()
+        self.visitor_log_writer.start()
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.start()
+        if self.unknown_store_saver is not None:
+            self.unknown_store_saver.start()
+        if self.pool_thread is not None:
+            self.pool_thread.start()
+        else:
+            for pipeline in self.pipelines:
+                pipeline.start_inference(self.stop_event)
+        return True
+
+    def pool_inference_loop(self):
+        """
+        Inference loop for process-pool mode: hands the newest frame of each
+        source to idle workers in round-robin order, so every camera gets a
+        fair share of the cores, and routes results back to their pipeline,
+        dropping any older than a result already applied for that source.
+        Tracking is bypassed in this mode; workers run the full pipeline.
+        """
+        # Size the shared-memory slots from the first real frames
+        frame_bytes = 0
+        while not frame_bytes:
+            if self.stop_event.is_set():
+                return
+            for pipeline in self.pipelines:
+                _, frame = pipeline.frame_buffer.latest(mark_read=False)
+                if frame is not None:
+                    frame_bytes = max(frame_bytes, frame.nbytes)
+            time.sleep(0.05)
+        try:
+            self.inference_pool.start(frame_bytes)
+        except Exception as e:
+            # Without a consumer, lockstep file replay would hang and the display would show no results
+            logger.error(f"Failed to start face inference workers, falling back to in-process inference: {e}")
+            for pipeline in self.pipelines:
+                pipeline.start_inference(self.stop_event)
+            return
+
+        applied_seq = {p.index: 0 for p in self.pipelines}
+        by_index = {p.index: p for p in self.pipelines}
+        next_source = 0
+        while not self.stop_event.is_set():
+            submitted = False
+            for _ in range(len(self.pipelines)):
+                if not self.inference_pool.has_idle_worker():
+                    break
+                pipeline = self.pipelines[next_source]
+                next_source = (next_source + 1) % len(self.pipelines)
+                frame = pipeline.next_frame(timeout=0)
+                if frame is None:
+                    continue
+                if pipeline.should_infer(frame):
+                    submitted = self.inference_pool.submit(frame, (pipeline.index, pipeline.seq)) or submitted
+                else:
+                    pipeline.reuse_previous()
+
+            wait = 0 if submitted and self.inference_pool.has_idle_worker() else 0.02
+            for (index, seq), detections, error in self.inference_pool.collect(timeout=wait):
+                if error:
+                    logger.error(f"Face recognition error: {error}")
+                if seq <= applied_seq[index]:
+                    continue
+                applied_seq[index] = seq
+                pipeline = by_index[index]
+                names = pipeline.label_unknowns([face for face, _, _ in detections], [name for _, name, _ in detections])
+                pipeline.publish([(face, name, sim) for (face, _, sim), name in zip(detections, names)])
+
+    def _on_gallery_reload(self, gallery):
+        """Swaps in a reloaded gallery; pipelines pick it up on their next frame."""
+        self.gallery = gallery
+        if self.inference_pool is not None:
+            self.inference_pool.update_gallery(gallery)
+        if self.unknown_store is not None:
+            self.unknown_store.forget_promoted(gallery)
+
+    def _on_detections(self, pipeline: CameraPipeline, detections):
+        """Reports the names seen by a camera to the shared visitor sessions."""
+        with self.timer.stage("visitors"):
+            self.presence.observe(name for _, name, _ in detections)
+
+    def headless_loop(self):
+        """
+        Runs the pipelines without any window. Ends when every source is a
+        video file that has been fully processed, or on Ctrl+C. Frame
+        requests from the tools are still served from the primary camera.
+        """
+        if not self.start_pipelines():
+            return
+
+        logger.info(f"Video Agent is running headless on {len(self.pipelines)} source(s). Press Ctrl+C to quit.")
+
+        try:
+            while not self.stop_event.is_set():
+                if all(p.is_finished() for p in self.pipelines) and not (
+                    self.inference_pool is not None and self.inference_pool.is_busy()
+                ):
+                    logger.info("All video sources finished.")
+                    break
+                self.presence.tick()
+
+                time.sleep(0.01)
+
+        except KeyboardInterrupt:
+            logger.info("Interrupted by user.")
+        finally:
+            self.stop()
 
     def display_loop(self):
         """
-        Main video capture and processing loop.
+        Main display loop. Shows the newest frame of every camera with its
+        most recent recognition results overlaid, independent of inference speed.
         """
-        logger.info(f"Opening camera index {Config.CAMERA_INDEX}...")
-        cap = cv2.VideoCapture(Config.CAMERA_INDEX)
-        
-        if not cap.isOpened():
-            logger.error(f"Cannot open camera {Config.CAMERA_INDEX}")
+        if not self.start_pipelines():
             return
 
-        # Optional: Set resolution
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, Config.CAMERA_FRAME_WIDTH)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, Config.CAMERA_FRAME_HEIGHT)
+        logger.info(f"Video Agent is running on {len(self.pipelines)} camera(s). Press 'q' to quit.")
 
-        logger.info("Video Agent is running. Press 'q' to quit.")
-        
+        shown_seq = {p.index: 0 for p in self.pipelines}
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning("Failed to grab compressed frame.")
-                    time.sleep(0.1)
-                    continue
+                updated = False
+                for pipeline in self.pipelines:
+                    seq, frame = pipeline.frame_buffer.latest(mark_read=False)
+                    if frame is None or seq == shown_seq[pipeline.index]:
+                        continue
+                    shown_seq[pipeline.index] = seq
+                    updated = True
 
-                # Mirror frame
-                frame = cv2.flip(frame, 1)
-
-                # Face Recognition
-                names = []
-                try:
-                    faces = face_model.get(frame)
-                    for face in faces:
-                        emb = face.normed_embedding
-                        name, sim = recognize_face(emb, self.known_faces, Config.FACE_RECOG_THRESHOLD)
-                        frame = draw_box(face, name, sim, frame)
-                        names.append(name)
-                except Exception as e:
-                    logger.error(f"Face recognition error: {e}")
-
-                # Update Visitors Log
-                self.active_visitors = update_visitors(
-                    names, 
-                    self.active_visitors, 
-                    str(Config.VISITOR_LOG_PATH), 
-                    grace_period_sec=20
-                )
+                    with self.timer.stage("display"):
+                        frame = pipeline.annotate(frame)
 
-                # Handle Frame Requests from Agents
-                if not self.frame_request_queue.empty():
-                    req = self.frame_request_queue.get()
-                    if req == "CAPTURE":
-                        # Send copy of frame (numpy array) to avoid threading issues
-                        self.frame_response_queue.put(frame.copy())
-                    elif req == "get_frame":
-                        # Legacy/Web support
-                        _, jpeg = cv2.imencode(".jpg", frame)
-                        frame_bytes = jpeg.tobytes()
-                        self.frame_response_queue.put(frame_bytes)
-
-                # Display
-                cv2.imshow("Video Agent", frame)
+                    # Display
+                    cv2.imshow(pipeline.window_name, frame)
 
+                self.presence.tick()
                 if cv2.waitKey(1) & 0xFF == ord("q"):
                     break
-                    
+                if not updated:
+                    time.sleep(0.005)
+
         except KeyboardInterrupt:
             logger.info("Interrupted by user.")
         finally:
-            self.stop(cap)
+            self.stop()
 
-    def stop(self, cap):
+    def stop(self):
         """
         Cleanup resources.
         """
         logger.info("Stopping Video Agent...")
-        if cap:
-            cap.release()
-        cv2.destroyAllWindows()
+        self.stop_event.set()
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.stop()
+        if self.unknown_store_saver is not None:
+            self.unknown_store_saver.stop()
+        for pipeline in self.pipelines:
+            pipeline.stop()
+        if self.pool_thread is not None and self.pool_thread.is_alive():
+            self.pool_thread.join(timeout=2)
+        if self.inference_pool is not None and self.inference_pool.started:
+            self.inference_pool.close()
+        # Sessions still open would otherwise be lost
+        self.presence.flush()
+        self.visitor_log_writer.close()
+        logger.info(f"Visitor log writer: {self.visitor_log_writer.stats()}")
+        self.item_writer.close()
+        logger.info(f"Item writer: {self.item_writer.stats()}")
+        if self.unknown_store is not None:
+            try:
+                self.unknown_store.save(Config.UNKNOWN_STORE_PATH)
+                logger.info(
+                    f"Unknown faces: {len(self.unknown_store)} provisional identities, "
+                    f"{self.unknown_store.clusters_created} created, {self.unknown_store.clusters_evicted} evicted"
+                )
+            except Exception as e:
+                logger.error(f"Failed to save unknown face store: {e}")
+        for pipeline in self.pipelines:
+            pipeline.log_stats()
+        self.log_summary()
+        if not Config.HEADLESS:
+            cv2.destroyAllWindows()
         logger.info("Goodbye!")
+
+    def log_summary(self):
+        """Logs frames processed, effective FPS and per-stage timings for the run."""
+        if self.started_at is None:
+            return
+        elapsed = time.perf_counter() - self.started_at
+        processed = sum(p.frames_processed for p in self.pipelines)
+        fps = processed / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Run summary: {processed} frames processed in {elapsed:.1f}s ({fps:.1f} FPS)")
+        for stage, (calls, total, mean_ms) in sorted(self.timer.summary().items()):
+            logger.info(f"  {stage:<12} calls={calls:<7} total={total:8.2f}s mean={mean_ms:7.2f} ms")
@@ -0,0 +1,85 @@
+import time
+import queue
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, List, Tuple
+
+from logger import logger
+
+
+class BatchWriterThread(threading.Thread, ABC):
+    """
+    Background thread draining a bounded queue in batches: it blocks for the
+    first record, then collects more until `batch_size` is reached or
+    `batch_sec` has passed, and hands the batch to write_batch(). Producers
+    never block; enqueue() returns False when the queue is full. close()
+    writes everything already queued, then calls on_stop() on the thread.
+    """
+    def __init__(self, name: str, queue_size: int, batch_size: int, batch_sec: float):
+        super().__init__(daemon=True, name=name)
+        self.batch_size = batch_size
+        self.batch_sec = batch_sec
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.max_depth = 0
+
+    def enqueue(self, record: Any) -> bool:
+        """Queues a record without blocking; False if the queue is full."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            return False
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    @abstractmethod
+    def write_batch(self, batch: List[Any]):
+        """Writes one batch. Exceptions are logged and the batch is dropped."""
+
+    def on_stop(self):
+        """Runs on the writer thread after the last batch was written."""
+
+    def _next_batch(self) -> Tuple[List[Any], bool]:
+        """Blocks for the first record, then collects more until the batch fills or times out."""
+        batch, stopping = [], False
+        record = self._queue.get()
+        deadline = time.monotonic() + self.batch_sec
+        while True:
+            if record is None:
+                stopping = True
+                break
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                break
+            try:
+                record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+        return batch, stopping
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.error(f"{self.name} failed to write {len(batch)} records: {e}", exc_info=True)
+        self.on_stop()
+
+    def close(self, timeout: float = 5.0):
+        """
+        Writes everything queued so far, then stops the thread. Gives up
+        after `timeout` if the writer is stuck, leaving the queue unwritten.
+        """
+        if not self.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error(f"{self.name} is stuck; {self._queue.qsize()} queued records were not written")
+            return
+        self.join(timeout=timeout)
+        if self.is_alive():
+            logger.error(f"{self.name} did not finish in {timeout}s; {self._queue.qsize()} queued records were not written")
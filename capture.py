@@ -0,0 +1,273 @@
+import os
+import cv2
+import time
+import threading
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from logger import logger
+
+
+def parse_camera_source(source):
+    """
+    Normalizes a camera source: device indices (int or digit strings such as
+    "0") become ints, anything else (video file path, stream URL) is passed
+    to cv2.VideoCapture unchanged.
+    """
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source)
+    return source
+
+
+def is_file_source(source) -> bool:
+    """True for recorded video files (replayed frame by frame, ending at EOF)."""
+    return isinstance(source, (str, os.PathLike)) and os.path.isfile(source)
+
+
+class FrameRingBuffer:
+    """
+    Small fixed-size ring of the most recent frames.
+    The producer never blocks; consumers always read the newest frame and
+    frames overwritten before anyone read them are counted as dropped.
+    """
+    def __init__(self, capacity: int = 3):
+        self.capacity = max(1, capacity)
+        self._slots = [None] * self.capacity
+        self._read_flags = [True] * self.capacity
+        self._seq = 0
+        self._read_seq = 0
+        self.dropped = 0
+        self._cond = threading.Condition()
+
+    def put(self, frame: np.ndarray) -> int:
+        """Stores a frame and returns its sequence number."""
+        with self._cond:
+            self._seq += 1
+            slot = self._seq % self.capacity
+            if not self._read_flags[slot]:
+                self.dropped += 1
+            self._slots[slot] = frame
+            self._read_flags[slot] = False
+            self._cond.notify_all()
+            return self._seq
+
+    def latest(self, mark_read: bool = True) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Returns (seq, frame) for the newest frame without waiting.
+        Observers such as the display pass mark_read=False so only real
+        consumers count towards the dropped-frame statistics.
+        """
+        with self._cond:
+            return self._take_latest(mark_read)
+
+    def wait_newer(self, seq: int, timeout: Optional[float] = None) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Blocks until a frame newer than `seq` is available (or timeout),
+        then returns the newest one. Returns (seq, None) on timeout.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > seq, timeout=timeout):
+                return seq, None
+            return self._take_latest()
+
+    def wait_consumed(self, seq: int, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until a consumer has read frame `seq` (or a newer one).
+        Used by lockstep producers so no frame is ever skipped.
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._read_seq >= seq, timeout=timeout)
+
+    def _take_latest(self, mark_read: bool = True) -> Tuple[int, Optional[np.ndarray]]:
+        if self._seq == 0:
+            return 0, None
+        slot = self._seq % self.capacity
+        if mark_read:
+            self._read_flags[slot] = True
+            self._read_seq = self._seq
+            self._cond.notify_all()
+        return self._seq, self._slots[slot]
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+
+class FrameSnapshot:
+    """
+    Instant, thread-safe access to the newest frame of a FrameRingBuffer for
+    tools and other occasional readers. Nothing runs on the video loop: the
+    reader takes the newest frame (published frames are never modified),
+    renders it (e.g. draws the detections, which copies) on its own thread
+    and caches the result and its JPEG encoding per frame sequence number,
+    so concurrent readers of the same frame share one render and one encode.
+    Returned frames are read-only.
+    """
+    def __init__(self, buffer: FrameRingBuffer, render: Optional[Callable[[np.ndarray], np.ndarray]] = None):
+        self.buffer = buffer
+        self.render = render
+        self._lock = threading.Lock()  # Only taken by readers
+        self._seq = 0
+        self._frame = None
+        self._jpeg = None
+
+        # Stats
+        self.renders = 0
+        self.encodes = 0
+
+    def frame(self) -> Tuple[int, Optional[np.ndarray]]:
+        """(seq, frame) for the newest frame, or (0, None) before the first one."""
+        seq, frame = self.buffer.latest(mark_read=False)
+        if frame is None:
+            return 0, None
+        with self._lock:
+            if seq != self._seq:
+                frame = self.render(frame) if self.render is not None else frame.copy()
+                frame.flags.writeable = False
+                self._seq, self._frame, self._jpeg = seq, frame, None
+                self.renders += 1
+            return self._seq, self._frame
+
+    def jpeg(self) -> Tuple[int, Optional[bytes]]:
+        """(seq, JPEG bytes) for the newest frame, encoded at most once per frame."""
+        seq, frame = self.frame()
+        if frame is None:
+            return 0, None
+        with self._lock:
+            if seq == self._seq and self._jpeg is not None:
+                return seq, self._jpeg
+        ok, encoded = cv2.imencode(".jpg", frame)
+        if not ok:
+            return seq, None
+        jpeg = encoded.tobytes()
+        with self._lock:
+            if seq == self._seq:
+                self._jpeg = jpeg
+                self.encodes += 1
+        return seq, jpeg
+
+
+class CaptureThread(threading.Thread):
+    """
+    Producer thread that reads frames from a cv2.VideoCapture as fast as the
+    device delivers them and publishes them into a FrameRingBuffer, so slow
+    consumers never see stale, driver-queued frames.
+
+    With a FrameRateGovernor attached, frames arriving faster than the
+    governor's current rate are grabbed (to keep the driver queue fresh)
+    but not decoded or published.
+
+    Recorded video files are replayed frame-accurately instead: each frame
+    is only published once the previous one was consumed, pacing follows the
+    file's FPS unless `realtime` is False, and the thread ends at EOF.
+    """
+    def __init__(
+        self,
+        source,
+        buffer: FrameRingBuffer,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        mirror: bool = True,
+        realtime: bool = True,
+        timer=None,
+        governor=None,
+        name: str = "CaptureThread"
+    ):
+        super().__init__(daemon=True, name=name)
+        self.source = source
+        self.buffer = buffer
+        self.width = width
+        self.height = height
+        self.mirror = mirror
+        self.realtime = realtime
+        self.timer = timer
+        self.governor = governor if not is_file_source(source) else None
+        self.is_file = is_file_source(source)
+        self.frames_captured = 0
+        self.opened = threading.Event()
+        self.failed = threading.Event()
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+        self._cap = None
+
+    def run(self):
+        logger.info(f"Opening camera source {self.source}...")
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            logger.error(f"Cannot open camera {self.source}")
+            self.failed.set()
+            return
+
+        if not self.is_file:
+            if self.width:
+                self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            if self.height:
+                self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.opened.set()
+
+        fps = self._cap.get(cv2.CAP_PROP_FPS) if self.is_file else 0
+        frame_interval = 1.0 / fps if fps and fps > 0 else 0
+        next_due = time.monotonic()
+        last_published = 0.0
+
+        try:
+            while not self._stop_event.is_set():
+                if self.governor is not None:
+                    interval = self.governor.frame_interval()
+                    if interval and time.monotonic() - last_published < interval:
+                        if not self._cap.grab():
+                            time.sleep(0.1)
+                        continue
+
+                start = time.perf_counter()
+                ret, frame = self._cap.read()
+                if not ret:
+                    if self.is_file:
+                        logger.info(f"Reached end of video file {self.source}")
+                        break
+                    logger.warning("Failed to grab compressed frame.")
+                    time.sleep(0.1)
+                    continue
+
+                if self.mirror:
+                    frame = cv2.flip(frame, 1)
+                if self.timer is not None:
+                    self.timer.add("capture", time.perf_counter() - start)
+
+                if self.is_file and self.realtime and frame_interval:
+                    next_due += frame_interval
+                    delay = next_due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                seq = self.buffer.put(frame)
+                self.frames_captured += 1
+                last_published = time.monotonic()
+
+                if self.is_file:
+                    # Lockstep: never overwrite a frame nobody has processed yet
+                    while not self.buffer.wait_consumed(seq, timeout=0.1):
+                        if self._stop_event.is_set():
+                            break
+        finally:
+            self._cap.release()
+            self.finished.set()
+            logger.info(
+                f"Capture stopped: {self.frames_captured} frames captured, "
+                f"{self.buffer.dropped} dropped before processing."
+            )
+
+    def wait_until_ready(self, timeout: float = 5.0) -> bool:
+        """Waits for the device to open; returns False if it failed or timed out."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.opened.is_set():
+                return True
+            if self.failed.is_set() or not self.is_alive():
+                return False
+            time.sleep(0.01)
+        return self.opened.is_set()
+
+    def stop(self):
+        self._stop_event.set()
@@ -31,19 +31,86 @@ class Config:
     VOSK_MODEL_PATH = MODELS_DIR / "vosk-model"
     
     # File Paths
-    VISITOR_LOG_PATH = DATA_DIR / "visitor_log.txt"
+    VISITOR_LOG_PATH = DATA_DIR / "visitor_log.txt"  # Legacy JSONL log, imported into VISITOR_DB_PATH
+    VISITOR_DB_PATH = DATA_DIR / "visitors.db"
+    VISITOR_LOG_TOOL_LIMIT = 200  # Most recent sessions returned by the GetVisitorLog tool
     DB_PATH = DATA_DIR / "item_log.db"
     ITEM_FRAMES_DIR = DATA_DIR / "item_frames"
+    ITEM_PAGE_SIZE = 20  # Items per page for listing/search results and the viewer
+    ITEM_WRITE_QUEUE_SIZE = 100    # Stored items waiting for the background writer
+    ITEM_WRITE_BATCH_SIZE = 20
+    ITEM_WRITE_BATCH_SEC = 0.05    # Max wait to group a burst into one transaction
+    VISITOR_GRACE_PERIOD_SEC = 20  # Absence after which a visitor's session is closed
+    VISITOR_LOG_QUEUE_SIZE = 1000  # Sessions buffered for the background writer before dropping (lost on a crash)
+    VISITOR_LOG_BATCH_SIZE = 50
+    VISITOR_LOG_BATCH_SEC = 1.0    # Max wait to fill a batch
+    VISITOR_LOG_FSYNC = "batch"    # Options: "batch" (sync every transaction), "interval", "never"
+    VISITOR_LOG_FSYNC_SEC = 5.0    # Checkpoint interval for the "interval" policy
+    UNKNOWN_STORE_PATH = DATA_DIR / "unknown_faces.npz"
     
     # Camera
     CAMERA_INDEX = 0
+    CAMERA_SOURCES = [CAMERA_INDEX]  # Device indices, video files or stream URLs; one pipeline each
     CAMERA_FRAME_WIDTH = 640  # Default, can be adjusted
     CAMERA_FRAME_HEIGHT = 480
+    FRAME_BUFFER_SIZE = 3  # Ring buffer slots between capture and consumers
+    REPLAY_REALTIME = True  # Video files: pace at the file's FPS (False = as fast as possible)
+    HEADLESS = False        # No windows; runs until file sources end or Ctrl+C
     
     # Face Recognition
+    FACE_MODEL_NAME = "buffalo_s"
+    FACE_ALLOWED_MODULES = ["detection", "recognition"]  # Skip landmark / gender-age heads
+    FACE_DET_SIZE = (640, 640)  # Detector input size; smaller is faster, misses small faces
+    FACE_DET_THRESH = 0.5
+    FACE_BENCHMARK_ON_STARTUP = False
     FACE_RECOG_THRESHOLD = 0.45
+    FACE_RECOG_TOP_K = 1  # Candidates returned per face by the batch matcher
+    FACE_QUALITY_GATE_ENABLED = True  # Skip recognition for faces unlikely to match
+    FACE_QUALITY_MIN_SIZE = 40        # Shorter side of the face box, pixels
+    FACE_QUALITY_MIN_DET_SCORE = 0.6
+    FACE_QUALITY_MAX_YAW = 0.6        # Nose offset / eye distance; ~0 frontal, larger = turned away
+    FACE_QUALITY_MIN_SHARPNESS = 20.0 # Laplacian variance of a 64x64 gray crop
+    FACE_MAX_TEMPLATES = 5  # Templates kept per person at enrollment (clusters of their photos)
+    UNKNOWN_CLUSTERING_ENABLED = True  # Give recurring unknown faces provisional IDs (unknown-17)
+    UNKNOWN_MATCH_THRESHOLD = 0.5      # Similarity to join an existing unknown cluster
+    UNKNOWN_MAX_CLUSTERS = 500
+    UNKNOWN_MAX_AGE_SEC = 7 * 24 * 3600  # Forget unknowns not seen for a week
+    UNKNOWN_SAMPLES_PER_CLUSTER = 10     # Embeddings kept for promotion to a named identity
+    UNKNOWN_SAVE_SEC = 30.0              # How often a changed store is written to UNKNOWN_STORE_PATH
+    GALLERY_HOT_RELOAD = True   # Watch faces/embeddings/gallery.json and swap in changes
+    GALLERY_RELOAD_SEC = 2.0
+    GALLERY_INDEX = "exact"        # Options: "exact" (brute force), "ivf" (approximate, numpy)
+    IVF_NLISTS = 0                 # 0 = sqrt(gallery size)
+    IVF_NPROBE = 16                # Lists scanned per query; higher = better recall, slower
+    IVF_MIN_GALLERY_SIZE = 20000   # Below this, exact search is as fast and always correct
+    
+    # Frame-rate governor (drops to a low rate when the room is empty)
+    GOVERNOR_ENABLED = True
+    GOVERNOR_ACTIVE_FPS = 0        # 0 = as fast as the camera delivers
+    GOVERNOR_IDLE_FPS = 2.0
+    GOVERNOR_IDLE_AFTER_SEC = 60.0  # Seconds without faces or motion before going idle
+    
+    INFERENCE_WORKERS = 0  # >0 runs detection + recognition in that many worker processes
+    
+    # Tracking (full detection every N frames, optical flow in between)
+    TRACKING_ENABLED = True
+    DETECT_EVERY_N_FRAMES = 5
+    TRACK_CONFIRM_THRESHOLD = 0.55  # Similarity at which a track's identity is cached
+    TRACK_REVERIFY_SEC = 10.0       # Re-embed confirmed tracks this often
+    
+    # Motion gate (skip face inference on static scenes)
+    MOTION_GATE_ENABLED = True
+    MOTION_PIXEL_THRESHOLD = 25     # Per-pixel gray-level change that counts as motion
+    MOTION_CHANGED_FRACTION = 0.01  # Fraction of changed pixels that triggers inference
+    MOTION_REFRESH_SEC = 5.0        # Forced inference interval; keep below the visitor grace period
+    
+    # ONNX Runtime (0 lets ORT pick)
+    ORT_INTRA_OP_THREADS = 0
+    ORT_INTER_OP_THREADS = 0
+    ORT_GRAPH_OPT_LEVEL = "all"  # Options: "disable", "basic", "extended", "all"
     
     # Speech & Audio
+    SPEECH_ENABLED = True
     PAUSE_THRESHOLD = 1.2
     
     # API Keys
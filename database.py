@@ -1,21 +1,97 @@
 
+import re
 import sqlite3
+import threading
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, Iterator, List, Tuple, Optional
 from logger import logger
 
+class SQLiteConnections:
+    """
+    Long-lived SQLite connections, one per thread, so queries don't pay for
+    opening the database (slow on SD cards) on every call. Each connection
+    is tuned with `pragmas` on creation and keeps sqlite3's per-connection
+    statement cache, so repeated queries reuse their prepared statements.
+    Use `with connections.get() as conn:` for a transaction; the connection
+    itself stays open until close_all().
+    """
+    DEFAULT_PRAGMAS = {
+        "journal_mode": "WAL",     # Readers don't block the writer
+        "synchronous": "NORMAL",   # Safe with WAL; syncs at checkpoints, not every commit
+        "temp_store": "MEMORY",
+        "cache_size": -8000,       # KiB (8 MB page cache)
+        "mmap_size": 64 * 1024 * 1024,
+        "busy_timeout": 5000,      # ms to wait on a lock held by another connection
+    }
+
+    def __init__(self, db_path: Path, pragmas: Optional[Dict[str, object]] = None, cached_statements: int = 256):
+        self.db_path = db_path
+        self.pragmas = {**self.DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Only ever used by this thread; check_same_thread=False just lets close_all() close it
+            conn = sqlite3.connect(self.db_path, cached_statements=self.cached_statements, check_same_thread=False)
+            for name, value in self.pragmas.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def close_all(self):
+        """Closes every thread's connection (on shutdown)."""
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            conn.close()
+        self._local = threading.local()
+
 class ItemDatabase:
     """
     Handles all interactions with the item logging database.
     """
+    # Column weights for bm25: the item name matters most, then the place
+    FTS_WEIGHTS = (10.0, 3.0, 1.0)
+
+    # Ranked full-text hits, or the most recent items when nothing matches, in one statement
+    SEARCH_SQL = f"""
+        WITH hits AS (
+            SELECT rowid AS id, bm25(item_fts, {', '.join(map(str, FTS_WEIGHTS))}) AS rank
+            FROM item_fts WHERE item_fts MATCH :query
+            ORDER BY rank LIMIT :limit
+        )
+        SELECT id, item_name, place_name, timestamp, image_path FROM (
+            SELECT i.id, i.item_name, i.place_name, i.timestamp, i.image_path, h.rank
+            FROM hits h JOIN item_log i ON i.id = h.id
+            UNION ALL
+            SELECT * FROM (
+                SELECT id, item_name, place_name, timestamp, image_path, 0.0 AS rank
+                FROM item_log WHERE NOT EXISTS (SELECT 1 FROM hits)
+                ORDER BY timestamp DESC, id DESC LIMIT :recent
+            )
+        ) ORDER BY rank, timestamp DESC, id DESC
+    """
+
     def __init__(self, db_path: Path):
         self.db_path = db_path
+        self.connections = SQLiteConnections(db_path)
+        self.fts_enabled = False
         self._initialize_db()
 
+    def close(self):
+        self.connections.close_all()
+
     def _initialize_db(self):
         """Creates the table if it doesn't exist."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.get() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS item_log (
@@ -27,15 +103,57 @@ class ItemDatabase:
                         description TEXT
                     )
                 """)
+                # Newest-first listing/paging reads the (timestamp, id) index instead of sorting the table
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_log_timestamp ON item_log (timestamp, id)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_item_log_item_name ON item_log (item_name)")
                 conn.commit()
             logger.info(f"Initialized item database at {self.db_path}")
         except Exception as e:
             logger.error(f"Failed to initialize database: {e}")
+        self._initialize_fts()
+
+    def _initialize_fts(self):
+        """
+        Creates the FTS5 index over item_log (external content, kept in sync
+        by triggers) and backfills it on first creation. Without FTS5 support
+        search falls back to LIKE scans.
+        """
+        try:
+            with self.connections.get() as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'item_fts'"
+                ).fetchone()
+                conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5(
+                        item_name, place_name, description,
+                        content = 'item_log', content_rowid = 'id', prefix = '2 3'
+                    );
+                    CREATE TRIGGER IF NOT EXISTS item_log_ai AFTER INSERT ON item_log BEGIN
+                        INSERT INTO item_fts (rowid, item_name, place_name, description)
+                        VALUES (new.id, new.item_name, new.place_name, new.description);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS item_log_ad AFTER DELETE ON item_log BEGIN
+                        INSERT INTO item_fts (item_fts, rowid, item_name, place_name, description)
+                        VALUES ('delete', old.id, old.item_name, old.place_name, old.description);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS item_log_au AFTER UPDATE ON item_log BEGIN
+                        INSERT INTO item_fts (item_fts, rowid, item_name, place_name, description)
+                        VALUES ('delete', old.id, old.item_name, old.place_name, old.description);
+                        INSERT INTO item_fts (rowid, item_name, place_name, description)
+                        VALUES (new.id, new.item_name, new.place_name, new.description);
+                    END;
+                """)
+                if not exists:
+                    conn.execute("INSERT INTO item_fts (item_fts) VALUES ('rebuild')")
+                    logger.info("Built full-text index for stored items")
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable, using LIKE search: {e}")
 
     def log_item(self, item_name: str, place_name: str, image_path: str, description: str = "") -> bool:
         """Logs an item's location."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.get() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "INSERT INTO item_log (item_name, place_name, image_path, description) VALUES (?, ?, ?, ?)",
@@ -48,10 +166,27 @@ class ItemDatabase:
             logger.error(f"Failed to log item: {e}")
             return False
 
+    def log_items(self, items: List[Tuple[str, str, str, str]]) -> List[int]:
+        """
+        Logs several (item_name, place_name, image_path, description) rows in
+        one transaction and returns their IDs. Raises on failure, in which
+        case nothing is stored.
+        """
+        with self.connections.get() as conn:
+            ids = [
+                conn.execute(
+                    "INSERT INTO item_log (item_name, place_name, image_path, description) VALUES (?, ?, ?, ?)",
+                    (item_name.lower(), place_name.lower(), str(image_path), description)
+                ).lastrowid
+                for item_name, place_name, image_path, description in items
+            ]
+        logger.info(f"Logged {len(ids)} items")
+        return ids
+
     def delete_item(self, item_id: int) -> bool:
         """Deletes an item by ID and removes its image file."""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.get() as conn:
                 cursor = conn.cursor()
                 
                 # Fetch image path before deletion
@@ -76,16 +211,40 @@ class ItemDatabase:
             logger.error(f"Failed to delete item {item_id}: {e}")
             return False
 
-    def search_items(self, query: str) -> List[Tuple]:
+    @staticmethod
+    def _fts_query(query: str) -> str:
+        """Any of the query's words, each as a quoted prefix term ("pen"* also finds "pencil")."""
+        return " OR ".join(f'"{token}"*' for token in re.findall(r"\w+", query))
+
+    def search_items(self, query: str, limit: int = 20) -> List[Tuple]:
         """
-        Smart search: Exact match -> Token match -> Recent items (fallback).
+        Smart search: BM25-ranked full-text match on item name, place and
+        description (prefix terms, any word), falling back to the most recent
+        items when nothing matches, as a single indexed query. An empty query
+        returns the newest `limit` items (page through the rest with get_items_page).
         Returns list of tuples: (id, item_name, place_name, timestamp, image_path)
         """
         query = query.lower().strip()
-        
+        if not query:
+            return self.get_recent_items(limit)
+        if not self.fts_enabled:
+            return self._search_items_like(query)
+
+        match = self._fts_query(query)
+        if not match:
+            return self.get_recent_items()
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(self.SEARCH_SQL, {"query": match, "limit": limit, "recent": 5}).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to search items: {e}")
+            return []
+
+    def _search_items_like(self, query: str) -> List[Tuple]:
+        """Exact match -> Token match -> Recent items, for SQLite builds without FTS5."""
         # 1. Exact/Loose phrase match
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self.connections.get() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     "SELECT id, item_name, place_name, timestamp, image_path FROM item_log WHERE item_name LIKE ? ORDER BY timestamp DESC",
@@ -101,7 +260,7 @@ class ItemDatabase:
         tokens = query.split()
         if len(tokens) > 1:
             try:
-                with sqlite3.connect(self.db_path) as conn:
+                with self.connections.get() as conn:
                     cursor = conn.cursor()
                     conditions = " OR ".join(["item_name LIKE ?" for _ in tokens])
                     params = [f"%{t}%" for t in tokens]
@@ -121,29 +280,72 @@ class ItemDatabase:
 
     def get_recent_items(self, limit: int = 5) -> List[Tuple]:
         """Returns most recent items."""
+        return self.get_items_page(limit)[0]
+
+    def get_items_page(
+        self,
+        limit: int = 50,
+        after: Optional[Tuple[str, int]] = None
+    ) -> Tuple[List[Tuple], Optional[Tuple[str, int]]]:
+        """
+        One page of items, newest first, using keyset pagination: `after` is
+        the cursor returned with the previous page, so each page is an index
+        seek rather than an OFFSET scan, and deletions between pages don't
+        shift results. Returns (rows, cursor for the next page or None).
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT id, item_name, place_name, timestamp, image_path FROM item_log ORDER BY timestamp DESC LIMIT ?",
-                    (limit,)
-                )
-                return cursor.fetchall()
+            with self.connections.get() as conn:
+                if after is None:
+                    rows = conn.execute(
+                        "SELECT id, item_name, place_name, timestamp, image_path FROM item_log "
+                        "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                        (limit,)
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT id, item_name, place_name, timestamp, image_path FROM item_log "
+                        "WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT ?",
+                        (after[0], after[1], limit)
+                    ).fetchall()
         except Exception as e:
-            logger.error(f"Failed to get recent items: {e}")
-            return []
+            logger.error(f"Failed to get items page: {e}")
+            return [], None
+        cursor = (rows[-1][3], rows[-1][0]) if len(rows) == limit else None
+        return rows, cursor
+
+    def iter_items(self, page_size: int = 100) -> Iterator[Tuple]:
+        """Yields every item, newest first, fetching one page at a time."""
+        cursor = None
+        while True:
+            rows, cursor = self.get_items_page(page_size, cursor)
+            yield from rows
+            if cursor is None:
+                return
+
+    def get_item(self, item_id: int) -> Optional[Tuple]:
+        """(id, item_name, place_name, timestamp, image_path) or None if it was deleted."""
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(
+                    "SELECT id, item_name, place_name, timestamp, image_path FROM item_log WHERE id = ?",
+                    (item_id,)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Failed to get item {item_id}: {e}")
+            return None
+
+    def count_items(self) -> int:
+        try:
+            with self.connections.get() as conn:
+                return conn.execute("SELECT COUNT(*) FROM item_log").fetchone()[0]
+        except Exception as e:
+            logger.error(f"Failed to count items: {e}")
+            return 0
 
     def find_item(self, item_name: str) -> List[Tuple]:
         """Legacy alias for backward compatibility or simple exact search."""
         return self.search_items(item_name)
 
     def get_all_items(self) -> List[Tuple[str, str, str]]:
-        """Returns all logged items."""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT item_name, place_name, timestamp FROM item_log ORDER BY timestamp DESC")
-                return cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Failed to retrieve all items: {e}")
-            return []
+        """Returns all logged items. Prefer iter_items() for large histories."""
+        return [(name, place, timestamp) for _, name, place, timestamp, _ in self.iter_items()]
@@ -1,46 +1,276 @@
+"""
+Enrolls the people under faces/people/<name>/ into the gallery the agent loads.
+
+    python faces/create_embeddings.py [--people DIR] [--output DIR] [--workers N] [--force]
+
+Photos are embedded by a pool of worker processes. Every photo is keyed by a
+hash of its content, and its embedding is cached in the output directory.
+On the next run only new or changed photos are embedded, and only identities
+whose photo set changed get new templates. The result is written directly as
+a consolidated gallery (gallery.json + matrix), so a running agent hot-reloads it.
+"""
 import os
+import sys
+import time
+import hashlib
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 import cv2
 import numpy as np
-import insightface
 
-# Prepare the model
-model = insightface.app.FaceAnalysis(name='buffalo_s')
-model.prepare(ctx_id=-1)  # CPU
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import Config
+from logger import logger
+from gallery import EMBEDDING_DIM, FaceGallery, select_templates
 
-def compute_average_embedding(image_folder):
-    embeddings = []
+PEOPLE_DIR = Config.FACES_DIR / "people"
+CACHE_FILE = "enrollment-cache.npz"
+
+_model = None  # Face model of the current process, loaded lazily
+
+
+def _init_worker(single_threaded: bool = True):
+    """Pool initializer: one single-threaded model per process, so N workers use N cores."""
+    global _model
+    if single_threaded:
+        Config.ORT_INTRA_OP_THREADS = 1
+        Config.ORT_INTER_OP_THREADS = 1
+    from models.insightface_model import face_model
+    _model = face_model
+
+
+def embed_image(path: str) -> Tuple[str, Optional[np.ndarray], str]:
+    """Returns (path, normed embedding of the first face or None, message)."""
+    if _model is None:
+        _init_worker(single_threaded=False)
+    img = cv2.imread(path)
+    if img is None:
+        return path, None, "failed to read"
+    faces = _model.get(img)
+    if not faces:
+        return path, None, "no face detected"
+    return path, faces[0].normed_embedding.astype(np.float32), "ok"
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_people(people_dir: Path) -> Dict[str, Dict[str, Path]]:
+    """{person: {content hash: photo path}} for every photo under people_dir."""
+    people = {}
+    for folder in sorted(p for p in Path(people_dir).iterdir() if p.is_dir()):
+        photos = {}
+        for path in sorted(folder.iterdir()):
+            if path.is_file() and not path.name.startswith("."):
+                photos[file_hash(path)] = path
+        people[folder.name] = photos
+    return people
+
+
+def identity_digest(hashes) -> str:
+    """Fingerprint of a person's photo set; unchanged digest = unchanged templates."""
+    return hashlib.blake2b("".join(sorted(hashes)).encode(), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Photo content hash -> embedding (or "no face"), persisted as one .npz in
+    the gallery directory so unchanged photos are never embedded twice.
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Optional[np.ndarray]] = {}
+        if self.path.exists():
+            try:
+                with np.load(str(self.path)) as data:
+                    for h, emb, ok in zip(data["hashes"], data["embeddings"], data["has_face"]):
+                        self.entries[str(h)] = emb if ok else None
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable enrollment cache {self.path}: {e}")
+
+    def __contains__(self, h: str) -> bool:
+        return h in self.entries
 
-    for file_name in os.listdir(image_folder):
-        file_path = os.path.join(image_folder, file_name)
-        img = cv2.imread(file_path)
-        if img is None:
-            print(f"Failed to read {file_path}")
+    def get(self, h: str) -> Optional[np.ndarray]:
+        return self.entries.get(h)
+
+    def put(self, h: str, embedding: Optional[np.ndarray]):
+        self.entries[h] = embedding
+
+    def prune(self, keep):
+        self.entries = {h: e for h, e in self.entries.items() if h in keep}
+
+    def save(self):
+        hashes = list(self.entries)
+        embeddings = np.zeros((len(hashes), EMBEDDING_DIM), dtype=np.float32)
+        has_face = np.zeros(len(hashes), dtype=bool)
+        for i, h in enumerate(hashes):
+            if self.entries[h] is not None:
+                embeddings[i] = self.entries[h]
+                has_face[i] = True
+        tmp = Path(str(self.path) + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, hashes=np.array(hashes, dtype=str), embeddings=embeddings, has_face=has_face)
+        os.replace(tmp, self.path)
+
+
+def embed_photos(paths: List[Path], workers: int) -> Dict[Path, Optional[np.ndarray]]:
+    """Embeds photos in a process pool (workers=0 runs in this process)."""
+    results = {}
+    if not paths:
+        return results
+    if workers <= 0:
+        outputs = map(embed_image, map(str, paths))
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=min(workers, len(paths)),
+            mp_context=mp.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        outputs = executor.map(embed_image, map(str, paths), chunksize=8)
+    try:
+        for i, (path, embedding, message) in enumerate(outputs, 1):
+            if embedding is None:
+                logger.warning(f"{path}: {message}")
+            results[Path(path)] = embedding
+            if i % 100 == 0 or i == len(paths):
+                logger.info(f"Embedded {i}/{len(paths)} photos")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+def enroll(
+    people_dir: Path = PEOPLE_DIR,
+    output_dir: Path = Config.EMBEDDINGS_DIR,
+    workers: Optional[int] = None,
+    max_templates: int = Config.FACE_MAX_TEMPLATES,
+    force: bool = False
+) -> FaceGallery:
+    """
+    Brings the gallery in output_dir up to date with people_dir and returns
+    it. Identities whose photos (and max_templates) are unchanged keep their
+    stored templates; people whose folder was removed are dropped. Identities promoted from
+    unknown-face clusters have no photos and are always carried forward.
+    """
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    workers = (os.cpu_count() or 1) if workers is None else workers
+
+    people = scan_people(people_dir)
+    cache = EmbeddingCache(output_dir / CACHE_FILE)
+    try:
+        previous = FaceGallery.load(output_dir, mmap=False)
+    except Exception as e:
+        logger.error(f"Unreadable gallery in {output_dir}, rebuilding it from scratch: {e}")
+        previous = None
+    previous_by_name = {}
+    if previous is not None:
+        previous_by_name = {str(n): i for i, n in enumerate(previous.names)}
+
+    # Only photos never seen before (or everything, with --force) go to the pool
+    pending = {h: path for photos in people.values() for h, path in photos.items() if force or h not in cache}
+    logger.info(
+        f"Enrolling {len(people)} people: {sum(len(p) for p in people.values())} photos, "
+        f"{len(pending)} to embed with {workers or 'no'} worker processes"
+    )
+    embedded = embed_photos(list(pending.values()), workers)
+    for h, path in pending.items():
+        cache.put(h, embedded.get(path))
+
+    names, templates, metadata = [], [], []
+    updated = kept = 0
+    for name, photos in people.items():
+        digest = identity_digest(photos)
+        i = previous_by_name.get(name)
+        reusable = (
+            i is not None and not force
+            and previous.metadata[i].get("digest") == digest
+            and previous.metadata[i].get("max_templates") == max_templates
+        )
+        if reusable:
+            templates.append(np.array(previous.templates(i)))
+            metadata.append(previous.metadata[i])
+            names.append(name)
+            kept += 1
+            continue
+
+        embeddings = [cache.get(h) for h in photos if cache.get(h) is not None]
+        if not embeddings:
+            logger.error(f"No embeddings found for {name}, skipping")
             continue
+        templates.append(select_templates(np.stack(embeddings), max_templates))
+        metadata.append({
+            "digest": digest, "photos": len(embeddings), "max_templates": max_templates, "enrolled_at": time.time()
+        })
+        names.append(name)
+        updated += 1
+
+    # Promoted identities only exist in the gallery (unless a folder was since added for them)
+    promoted = 0
+    for name, i in previous_by_name.items():
+        if name not in people and "promoted_from" in previous.metadata[i]:
+            templates.append(np.array(previous.templates(i)))
+            metadata.append(previous.metadata[i])
+            names.append(name)
+            promoted += 1
+
+    removed = len(set(previous_by_name) - set(names))
+    cache.prune({h for photos in people.values() for h in photos})
+    cache.save()
 
-        faces = model.get(img)
-        if faces:
-            embedding = faces[0].normed_embedding
-            embeddings.append(embedding)
-            print(f"Got embedding from {file_name}")
-        else:
-            print(f"No face detected in {file_name}")
+    if not names:
+        logger.warning(f"No identities enrolled from {people_dir}")
+        gallery = FaceGallery.empty()
+        if removed:
+            # Otherwise the removed identities would stay on disk and keep matching
+            gallery.save(output_dir)
+            logger.warning(f"Removed all {removed} previously enrolled identities")
+        return gallery
+    offsets = np.concatenate([[0], np.cumsum([len(t) for t in templates])])
+    gallery = FaceGallery(names, np.concatenate(templates), metadata, offsets)
+    if force or updated or removed or previous is None:
+        gallery.save(output_dir)
+    logger.info(
+        f"Enrollment done in {time.perf_counter() - start:.1f}s: {updated} updated, "
+        f"{kept} unchanged, {promoted} promoted kept, {removed} removed"
+    )
+    return gallery
 
+
+def compute_average_embedding(image_folder):
+    """Single averaged embedding of a folder of photos (legacy one-template enrollment)."""
+    embeddings = [e for _, e, _ in map(embed_image, sorted(str(p) for p in Path(image_folder).iterdir())) if e is not None]
     if len(embeddings) == 0:
         raise ValueError(f"No embeddings found in {image_folder}")
-
     avg_embedding = np.mean(embeddings, axis=0)
     # Normalize the average to unit length
     avg_embedding /= np.linalg.norm(avg_embedding)
     return avg_embedding
 
-print()
 
-folders = os.listdir('./people')
-for folder in folders:# Compute and save embeddings
-    print(f'  -- Creating embeddings for {folder}  -- ')
-    full_folder = os.path.join('people', folder)
-    embed = compute_average_embedding(full_folder)
-    np.save(f"./embeddings/{folder}_embedding.npy", embed)
-    print()
+def main():
+    parser = argparse.ArgumentParser(description="Enroll faces/people/<name>/ photos into the face gallery.")
+    parser.add_argument("--people", type=Path, default=PEOPLE_DIR, help="One sub-folder of photos per person")
+    parser.add_argument("--output", type=Path, default=Config.EMBEDDINGS_DIR, help="Gallery directory")
+    parser.add_argument("--workers", type=int, default=None, help="Embedding processes (default: CPU count, 0 = in-process)")
+    parser.add_argument("--max_templates", type=int, default=Config.FACE_MAX_TEMPLATES)
+    parser.add_argument("--force", action="store_true", help="Ignore the cache and re-embed every photo")
+    args = parser.parse_args()
+    enroll(args.people, args.output, args.workers, args.max_templates, args.force)
+
 
-print("Embeddings saved!")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+import os
+import json
+import time
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from logger import logger
+
+EMBEDDING_DIM = 512
+GALLERY_INDEX_FILE = "gallery.json"
+GALLERY_FORMAT_VERSION = 2  # 2: multiple templates per identity (offsets)
+
+
+def select_top_k(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column ids and values of the k largest entries of each row, best first."""
+    if k == 1:
+        idx = np.argmax(sims, axis=1)[:, None]
+    else:
+        idx = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, idx, axis=1), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(sims, idx, axis=1)
+
+
+def exact_search(embeddings: np.ndarray, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Brute-force top-k cosine search of (M x D) queries against (N x D)
+    embeddings with one matrix multiply. Returns (M x k) row ids and scores,
+    best first.
+    """
+    # (M x D) @ (D x N) -> (M x N) cosine similarities for L2-normalized inputs
+    return select_top_k(queries @ embeddings.T, k)
+
+
+def select_templates(embeddings: np.ndarray, max_templates: int, iterations: int = 10) -> np.ndarray:
+    """
+    Reduces one person's photo embeddings to at most `max_templates`
+    representatives (normalized spherical k-means centroids), so varied
+    lighting and poses each keep a template instead of being averaged away.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    k = min(max_templates, len(embeddings))
+    if k <= 0:
+        raise ValueError("No embeddings to select templates from")
+    if k == 1:
+        mean = embeddings.mean(axis=0)
+        return (mean / np.linalg.norm(mean))[None, :]
+
+    # Farthest-point initialization keeps the seeds spread over poses
+    centroids = [embeddings[0]]
+    for _ in range(k - 1):
+        closest = np.max(embeddings @ np.stack(centroids).T, axis=1)
+        centroids.append(embeddings[np.argmin(closest)])
+    centroids = np.stack(centroids)
+
+    for _ in range(iterations):
+        assign = np.argmax(embeddings @ centroids.T, axis=1)
+        for c in range(k):
+            members = embeddings[assign == c]
+            if len(members):
+                mean = members.mean(axis=0)
+                centroids[c] = mean / np.linalg.norm(mean)
+    return centroids.astype(np.float32)
+
+
+class FaceGallery:
+    """
+    Enrolled identities stored as one contiguous (T x D) float32 matrix of
+    templates plus a parallel array of names, so a whole frame can be
+    matched with a single matrix multiply. Each identity owns one or more
+    consecutive template rows, delimited by `offsets` (N + 1 entries);
+    an identity's score is the max over its templates.
+
+    On disk a gallery is one .npy matrix (memory-mapped on load) plus a
+    small JSON index with names, offsets and per-identity metadata; see
+    save/load.
+    """
+    def __init__(
+        self,
+        names: List[str],
+        embeddings: np.ndarray,
+        metadata: Optional[List[dict]] = None,
+        offsets: Optional[np.ndarray] = None
+    ):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2:
+            embeddings = embeddings.reshape(-1, EMBEDDING_DIM)
+        if offsets is None:
+            offsets = np.arange(len(names) + 1)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if len(offsets) != len(names) + 1 or offsets[-1] != embeddings.shape[0]:
+            raise ValueError(
+                f"Gallery has {len(names)} names but {embeddings.shape[0]} templates "
+                f"and {len(offsets)} offsets"
+            )
+        if np.any(np.diff(offsets) <= 0):
+            raise ValueError("Every identity needs at least one template")
+        self.names = np.asarray(names, dtype=object)
+        self.embeddings = np.ascontiguousarray(embeddings)
+        self.offsets = offsets
+        self.metadata = list(metadata) if metadata is not None else [{} for _ in names]
+        self.generation: Optional[int] = None
+        self.index = None  # Optional ANN index over template rows (see gallery_index); None = exact search
+        # Identity of each template row
+        self._row_identity = np.repeat(np.arange(len(names)), np.diff(offsets))
+
+    @classmethod
+    def from_dict(cls, known_faces: Dict[str, np.ndarray]) -> "FaceGallery":
+        """
+        Builds a gallery from a {name: embedding} mapping. A value may be a
+        single (D,) embedding or a (K x D) stack of templates.
+        """
+        if not known_faces:
+            return cls.empty()
+        names = list(known_faces.keys())
+        templates = [np.asarray(known_faces[n], dtype=np.float32).reshape(-1, EMBEDDING_DIM) for n in names]
+        offsets = np.concatenate([[0], np.cumsum([len(t) for t in templates])])
+        return cls(names, np.concatenate(templates), offsets=offsets)
+
+    @classmethod
+    def empty(cls, dim: int = EMBEDDING_DIM) -> "FaceGallery":
+        return cls([], np.zeros((0, dim), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_templates(self) -> int:
+        return self.embeddings.shape[0]
+
+    def templates(self, i: int) -> np.ndarray:
+        """The (K x D) templates of identity i."""
+        return self.embeddings[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """{name: (K x D) templates}; the inverse of from_dict."""
+        return {str(name): np.array(self.templates(i)) for i, name in enumerate(self.names)}
+
+    def add_identity(self, name: str, templates: np.ndarray, metadata: Optional[dict] = None) -> "FaceGallery":
+        """
+        Returns a new gallery with `templates` added for `name` (appended to
+        its existing templates if already enrolled). The original is left
+        untouched, since live pipelines may still be matching against it.
+        """
+        known = self.to_dict()
+        meta = {str(n): m for n, m in zip(self.names, self.metadata)}
+        templates = np.asarray(templates, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        if name in known:
+            templates = np.concatenate([known[name], templates])
+        known[name] = templates
+        meta[name] = {**meta.get(name, {}), **(metadata or {})}
+        gallery = FaceGallery.from_dict(known)
+        gallery.metadata = [meta[str(n)] for n in gallery.names]
+        return gallery
+
+    # --- Persistence ---
+
+    def save(self, directory: Path) -> Path:
+        """
+        Writes the gallery atomically: a new generation-stamped matrix file is
+        written first, then the index is swapped in with os.replace, so a
+        reader never sees a half-written gallery. Older matrices are removed.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        generation = time.time_ns()
+        matrix_name = f"gallery-{generation}.npy"
+
+        tmp_matrix = directory / (matrix_name + ".tmp")
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, self.embeddings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_matrix, directory / matrix_name)
+
+        index = {
+            "version": GALLERY_FORMAT_VERSION,
+            "generation": generation,
+            "matrix": matrix_name,
+            "count": len(self),
+            "dim": int(self.embeddings.shape[1]),
+            "names": [str(n) for n in self.names],
+            "offsets": self.offsets.tolist(),
+            "metadata": self.metadata,
+        }
+        index_path = directory / GALLERY_INDEX_FILE
+        tmp_index = directory / (GALLERY_INDEX_FILE + ".tmp")
+        with open(tmp_index, "w") as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_index, index_path)
+
+        for old in directory.glob("gallery-*.npy"):
+            if old.name != matrix_name:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass  # Still mapped by a reader on some platforms; cleaned next save
+
+        logger.info(f"Saved gallery with {len(self)} identities to {index_path}")
+        return index_path
+
+    @classmethod
+    def load(cls, directory: Path, mmap: bool = True) -> Optional["FaceGallery"]:
+        """
+        Loads a consolidated gallery, memory-mapping the matrix so startup
+        cost does not grow with the number of identities.
+        Returns None if the directory has no gallery index.
+        """
+        index_path = Path(directory) / GALLERY_INDEX_FILE
+        if not index_path.exists():
+            return None
+        with open(index_path, "r") as f:
+            index = json.load(f)
+
+        if index.get("version") not in (1, GALLERY_FORMAT_VERSION):
+            raise ValueError(f"Unsupported gallery format version: {index.get('version')}")
+
+        matrix = np.load(str(Path(directory) / index["matrix"]), mmap_mode="r" if mmap else None)
+        # Version 1 galleries have exactly one template per identity
+        gallery = cls(index["names"], matrix, index.get("metadata"), index.get("offsets"))
+        gallery.generation = index.get("generation")
+        return gallery
+
+    def match(
+        self,
+        embeddings: np.ndarray,
+        threshold: float = 0.45,
+        top_k: int = 1
+    ) -> Tuple[List[List[str]], np.ndarray]:
+        """
+        Scores every query embedding against the whole gallery at once.
+        Returns (names, scores) where names[i] holds the top-k identities for
+        query i (best first, "Unknown" below threshold) and scores is an
+        (M x top_k) array of cosine similarities.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        num_queries = queries.shape[0]
+
+        if num_queries == 0 or len(self) == 0:
+            return [["Unknown"] * top_k for _ in range(num_queries)], np.zeros((num_queries, top_k), dtype=np.float32)
+
+        k = min(top_k, len(self))
+        if self.index is not None:
+            idx, scores = self._index_search(queries, k)
+        elif self.num_templates == len(self):
+            idx, scores = exact_search(self.embeddings, queries, k)
+        else:
+            # Max over each identity's templates in one vectorized reduction
+            sims = queries @ self.embeddings.T
+            identity_sims = np.maximum.reduceat(sims, self.offsets[:-1], axis=1)
+            idx, scores = select_top_k(identity_sims, k)
+
+        names = []
+        for row_idx, row_scores in zip(idx, scores):
+            row = [
+                self.names[j] if j >= 0 and s >= threshold else "Unknown"
+                for j, s in zip(row_idx, row_scores)
+            ]
+            row += ["Unknown"] * (top_k - k)
+            names.append(row)
+
+        if k < top_k:
+            scores = np.pad(scores, ((0, 0), (0, top_k - k)))
+
+        logger.debug(f"Matched {num_queries} faces against {len(self)} identities")
+        return names, scores
+
+    def _index_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches the template-level index and collapses hits to identities,
+        keeping each identity's best template. Over-fetches so k distinct
+        identities survive the collapse.
+        """
+        max_per_identity = int(np.max(np.diff(self.offsets)))
+        rows, row_scores = self.index.search(queries, min(k * max_per_identity, self.num_templates))
+        idx = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.zeros((len(queries), k), dtype=np.float32)
+        for i in range(len(queries)):
+            seen = []
+            for row, score in zip(rows[i], row_scores[i]):
+                if row < 0:
+                    continue
+                identity = self._row_identity[row]
+                if identity in seen:
+                    continue
+                idx[i, len(seen)] = identity
+                scores[i, len(seen)] = score
+                seen.append(identity)
+                if len(seen) == k:
+                    break
+        return idx, scores
+
+
+class GalleryWatcher(threading.Thread):
+    """
+    Polls the gallery index and, when it changes, loads the new gallery off
+    the video threads and hands it to `on_reload`. Consumers swap a single
+    reference, so new enrollments go live without a restart or dropped frames.
+    """
+    def __init__(
+        self,
+        directory: Path,
+        on_reload: Callable[[FaceGallery], None],
+        interval: float = 2.0,
+        loader: Optional[Callable[[Path], Optional[FaceGallery]]] = None
+    ):
+        super().__init__(daemon=True, name="GalleryWatcher")
+        self.index_path = Path(directory) / GALLERY_INDEX_FILE
+        self.on_reload = on_reload
+        self.loader = loader or FaceGallery.load
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last_mtime = self._mtime()
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return self.index_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            mtime = self._mtime()
+            if mtime is None or mtime == self._last_mtime:
+                continue
+            try:
+                gallery = self.loader(self.index_path.parent)
+            except Exception as e:
+                logger.error(f"Failed to reload gallery: {e}")
+                continue
+            self._last_mtime = mtime
+            logger.info(f"Gallery changed on disk, reloaded {len(gallery)} identities.")
+            self.on_reload(gallery)
+
+    def stop(self):
+        self._stop_event.set()
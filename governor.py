@@ -0,0 +1,64 @@
+import time
+import threading
+
+from logger import logger
+
+
+class FrameRateGovernor:
+    """
+    Switches a camera between an ACTIVE mode (full rate) and an IDLE mode
+    (low capture and inference rate) to save CPU on always-on units.
+    The pipeline reports activity (motion or a detected face) and the
+    governor drops to IDLE after `idle_after_sec` without any; the next
+    activity report ramps straight back to ACTIVE.
+    """
+    ACTIVE = "ACTIVE"
+    IDLE = "IDLE"
+
+    def __init__(self, active_fps: float = 0, idle_fps: float = 2.0, idle_after_sec: float = 60.0, label: str = ""):
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.idle_after_sec = idle_after_sec
+        self.label = label
+        self.mode = self.ACTIVE
+        self._last_activity = time.monotonic()
+        self._lock = threading.Lock()
+
+        # Stats
+        self.transitions = 0
+
+    @staticmethod
+    def _rate_str(fps: float) -> str:
+        return f"{fps:g} fps" if fps else "unthrottled"
+
+    def _switch(self, mode: str, reason: str):
+        old_fps, new_fps = self.fps_for(self.mode), self.fps_for(mode)
+        logger.info(
+            f"Governor{self.label}: {self.mode} -> {mode} "
+            f"({self._rate_str(old_fps)} -> {self._rate_str(new_fps)}) {reason}"
+        )
+        self.mode = mode
+        self.transitions += 1
+
+    def fps_for(self, mode: str) -> float:
+        return self.idle_fps if mode == self.IDLE else self.active_fps
+
+    def report_activity(self, reason: str = "activity"):
+        """Called when motion or a face is seen; ramps back to full rate."""
+        with self._lock:
+            self._last_activity = time.monotonic()
+            if self.mode == self.IDLE:
+                self._switch(self.ACTIVE, f"on {reason}")
+
+    def frame_interval(self) -> float:
+        """
+        Minimum seconds between processed frames for the current mode
+        (0 = no limit). Also performs the ACTIVE -> IDLE transition.
+        """
+        with self._lock:
+            if self.mode == self.ACTIVE:
+                quiet_for = time.monotonic() - self._last_activity
+                if quiet_for >= self.idle_after_sec:
+                    self._switch(self.IDLE, f"after {quiet_for:.0f}s without faces or motion")
+            fps = self.fps_for(self.mode)
+        return 1.0 / fps if fps else 0.0
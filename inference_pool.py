@@ -0,0 +1,236 @@
+import queue
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from logger import logger
+from gallery import FaceGallery
+
+
+def _worker_main(worker_id, shm_name, task_queue, result_queue, gallery, threshold, top_k):
+    """
+    Worker process entry point. Loads its own copy of the face model, then
+    serves frames handed over through its shared-memory slot.
+    `gallery` is a FaceGallery or the directory to load one from.
+    Messages on task_queue:
+      ("frame", tag, shape)  -> run detection + recognition on the slot
+      ("buffer", shm_name)   -> re-attach to a larger slot
+      ("gallery", directory) -> reload the gallery (and its index) from disk
+      None                   -> exit
+    """
+    # Each worker process holds its own ONNX sessions. Note that spawned
+    # workers also re-import the parent's __main__ module (and so the agent)
+    # before this function runs; deferring these imports only keeps this
+    # module itself light.
+    from models.insightface_model import recognize_faces, detect_faces, embed_faces
+    from quality import build_quality_gate
+    from gallery_index import load_indexed_gallery
+    quality_gate = build_quality_gate()
+    if not isinstance(gallery, FaceGallery):
+        gallery = load_indexed_gallery(gallery) or FaceGallery.empty()
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    result_queue.put((worker_id, None, [], None))  # ready
+
+    while True:
+        msg = task_queue.get()
+        if msg is None:
+            break
+
+        kind = msg[0]
+        if kind == "buffer":
+            shm.close()
+            shm = shared_memory.SharedMemory(name=msg[1])
+            continue
+        if kind == "gallery":
+            try:
+                gallery = load_indexed_gallery(msg[1]) or gallery
+            except Exception as e:
+                logger.error(f"[worker {worker_id}] Failed to reload gallery, keeping the previous one: {e}")
+            continue
+
+        _, tag, shape = msg
+        try:
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            faces = detect_faces(frame)
+            passed = quality_gate.filter(frame, faces) if quality_gate is not None else [True] * len(faces)
+            to_embed = [face for face, ok in zip(faces, passed) if ok]
+            embed_faces(frame, to_embed)
+            matches = iter(recognize_faces(to_embed, gallery, threshold, top_k))
+            detections = []
+            for face, ok in zip(faces, passed):
+                top_names, top_sims = next(matches) if ok else (["Unknown"], [0.0])
+                detections.append((face, top_names[0], top_sims[0]))
+            del frame
+            result_queue.put((worker_id, tag, detections, None))
+        except Exception as e:
+            result_queue.put((worker_id, tag, [], str(e)))
+
+    shm.close()
+    if quality_gate is not None:
+        quality_gate.log_stats(f"[worker {worker_id}] ")
+
+
+class FaceInferencePool:
+    """
+    Runs the InsightFace pipeline in worker processes so recognition can use
+    several cores without contending for the GIL with the speech threads.
+    Each worker owns one shared-memory frame slot: submit() copies the frame
+    into an idle worker's slot and sends only (tag, shape) over the queue;
+    results (Face objects with bbox/embedding, plus name and similarity)
+    come back on a shared result queue.
+    """
+    def __init__(
+        self,
+        num_workers: int,
+        gallery,
+        threshold: float = 0.45,
+        top_k: int = 1,
+        slot_bytes: int = 0,
+        gallery_dir: Optional[Path] = None
+    ):
+        self.num_workers = max(1, num_workers)
+        self.gallery = gallery
+        self.gallery_dir = gallery_dir
+        self.threshold = threshold
+        self.top_k = top_k
+        self.slot_bytes = slot_bytes
+        self._ctx = mp.get_context("spawn")
+        self._result_queue = self._ctx.Queue()
+        self._task_queues = []
+        self._slots: List[shared_memory.SharedMemory] = []
+        self._processes = []
+        self._idle = set()
+        self._started = False
+
+        # Stats
+        self.frames_submitted = 0
+        self.frames_rejected = 0
+
+    def start(self, frame_bytes: int):
+        """Spawns the workers with slots large enough for `frame_bytes` and waits until they are ready."""
+        self.slot_bytes = max(self.slot_bytes, frame_bytes)
+        # A gallery saved on disk is loaded (memory-mapped) by each worker rather than pickled to it
+        on_disk = self.gallery_dir is not None and self.gallery.generation is not None
+        gallery = self.gallery_dir if on_disk else self.gallery
+        for worker_id in range(self.num_workers):
+            shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes)
+            task_queue = self._ctx.Queue()
+            proc = self._ctx.Process(
+                target=_worker_main,
+                args=(worker_id, shm.name, task_queue, self._result_queue,
+                      gallery, self.threshold, self.top_k),
+                daemon=True,
+                name=f"FaceWorker-{worker_id}"
+            )
+            proc.start()
+            self._slots.append(shm)
+            self._task_queues.append(task_queue)
+            self._processes.append(proc)
+
+        ready = 0
+        while ready < self.num_workers:
+            try:
+                worker_id, _, _, _ = self._result_queue.get(timeout=1.0)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Face inference workers exited during startup: {dead}")
+                continue
+            self._idle.add(worker_id)
+            ready += 1
+        self._started = True
+        logger.info(f"Started {self.num_workers} face inference worker processes.")
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    def has_idle_worker(self) -> bool:
+        return bool(self._idle)
+
+    def is_busy(self) -> bool:
+        """True while any submitted frame has not come back yet."""
+        return self._started and len(self._idle) < self.num_workers
+
+    def submit(self, frame: np.ndarray, tag: Any) -> bool:
+        """
+        Hands a frame to an idle worker. Returns False (frame dropped) when
+        every worker is busy.
+        """
+        if not self._idle:
+            self.frames_rejected += 1
+            return False
+
+        worker_id = self._idle.pop()
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        shm = self._slots[worker_id]
+        if frame.nbytes > shm.size:
+            shm = self._grow_slot(worker_id, frame.nbytes)
+
+        np.ndarray(frame.shape, dtype=np.uint8, buffer=shm.buf)[...] = frame
+        self._task_queues[worker_id].put(("frame", tag, frame.shape))
+        self.frames_submitted += 1
+        return True
+
+    def collect(self, timeout: Optional[float] = None) -> List[Tuple[Any, list, Optional[str]]]:
+        """
+        Returns every finished result as (tag, detections, error), waiting up
+        to `timeout` for the first one. Workers that returned become idle.
+        """
+        results = []
+        try:
+            item = self._result_queue.get(timeout=timeout)
+            while True:
+                worker_id, tag, detections, error = item
+                self._idle.add(worker_id)
+                results.append((tag, detections, error))
+                item = self._result_queue.get_nowait()
+        except queue.Empty:
+            pass
+        return results
+
+    def update_gallery(self, gallery):
+        """
+        Tells every worker to reload the gallery from gallery_dir (applied
+        before their next frame) instead of pickling it to each of them.
+        """
+        self.gallery = gallery
+        if self.gallery_dir is None:
+            logger.warning("Inference pool has no gallery directory; workers keep the previous gallery")
+            return
+        for task_queue in self._task_queues:
+            task_queue.put(("gallery", self.gallery_dir))
+
+    def _grow_slot(self, worker_id: int, nbytes: int) -> shared_memory.SharedMemory:
+        old = self._slots[worker_id]
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._slots[worker_id] = shm
+        self._task_queues[worker_id].put(("buffer", shm.name))
+        # The worker detaches from the old slot when it reads the message;
+        # unlinking now only removes the name, the mapping stays valid.
+        old.close()
+        old.unlink()
+        return shm
+
+    def close(self):
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for proc in self._processes:
+            proc.join(timeout=2)
+            if proc.is_alive():
+                proc.terminate()
+        for shm in self._slots:
+            shm.close()
+            shm.unlink()
+        self._task_queues, self._processes, self._slots = [], [], []
+        self._idle.clear()
+        self._started = False
+        logger.info(
+            f"Inference pool closed: {self.frames_submitted} frames processed, "
+            f"{self.frames_rejected} dropped while all workers were busy."
+        )
@@ -0,0 +1,107 @@
+import cv2
+import time
+import numpy as np
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+from logger import logger
+from database import ItemDatabase
+from batch_writer import BatchWriterThread
+
+
+@dataclass
+class ItemWrite:
+    item_name: str
+    place_name: str
+    frame: np.ndarray
+    image_path: Path
+    description: str = ""
+    future: Future = field(default_factory=Future)
+
+
+class ItemWriter(BatchWriterThread):
+    """
+    Persists stored items (JPEG encode, image write, database insert) from a
+    background thread so StoreItemLocation can confirm as soon as the frame
+    is captured. Items that arrive together (waiting at most `batch_sec`
+    after the first, up to `batch_size`) are inserted in one transaction.
+
+    submit() returns a Future that resolves to the new item ID, or raises
+    if the image or the row could not be written. A full queue fails the
+    future immediately instead of blocking the caller.
+    """
+    def __init__(
+        self,
+        db: ItemDatabase,
+        queue_size: int = 100,
+        batch_size: int = 20,
+        batch_sec: float = 0.05
+    ):
+        super().__init__("ItemWriter", queue_size, batch_size, batch_sec)
+        self.db = db
+
+        # Stats
+        self.items_written = 0
+        self.items_failed = 0
+        self.batches_written = 0
+        self.max_write_sec = 0.0
+
+    def submit(self, item_name: str, place_name: str, frame: np.ndarray, image_path: Path,
+               description: str = "") -> Future:
+        """Queues an item without blocking. `frame` must not be modified afterwards."""
+        write = ItemWrite(item_name, place_name, frame, Path(image_path), description)
+        if not self.enqueue(write):
+            self.items_failed += 1
+            write.future.set_exception(RuntimeError("Item writer queue is full"))
+        return write.future
+
+    def _save_images(self, batch: List[ItemWrite]) -> List[ItemWrite]:
+        """Writes each item's image; items whose image fails are failed on their own."""
+        saved = []
+        for write in batch:
+            try:
+                if not cv2.imwrite(str(write.image_path), write.frame):
+                    raise IOError(f"Could not write {write.image_path}")
+                saved.append(write)
+            except Exception as e:
+                logger.error(f"Failed to save item image: {e}")
+                self.items_failed += 1
+                write.future.set_exception(e)
+            write.frame = None  # Release the frame as soon as it's encoded
+        return saved
+
+    def write_batch(self, batch: List[ItemWrite]):
+        start = time.monotonic()
+        saved = self._save_images(batch)
+        if not saved:
+            return
+        try:
+            ids = self.db.log_items([
+                (w.item_name, w.place_name, str(w.image_path), w.description) for w in saved
+            ])
+        except Exception as e:
+            logger.error(f"Failed to log {len(saved)} items: {e}")
+            self.items_failed += len(saved)
+            for write in saved:
+                write.image_path.unlink(missing_ok=True)  # Don't leave images without a row
+                write.future.set_exception(e)
+            return
+        for write, item_id in zip(saved, ids):
+            write.future.set_result(item_id)
+        self.max_write_sec = max(self.max_write_sec, time.monotonic() - start)
+        self.items_written += len(saved)
+        self.batches_written += 1
+
+    def on_stop(self):
+        self.db.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.items_written,
+            "failed": self.items_failed,
+            "batches": self.batches_written,
+            "max_write_ms": self.max_write_sec * 1000,
+        }
@@ -24,6 +24,33 @@ def parse_arguments():
         default="vosk",
         help="Select speech-to-text provider: 'vosk' (Offline), 'google' (Online Free), or 'openai' (Whisper API)."
     )
+    parser.add_argument(
+        "--camera_sources", "--video-source",
+        dest="camera_sources",
+        nargs="+",
+        default=None,
+        help="One or more video sources (device index, video file or stream URL). Defaults to Config.CAMERA_SOURCES."
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Run without a display window (servers, CI). Ends when video file sources finish."
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Replay video files as fast as possible instead of at their recorded frame rate."
+    )
+    parser.add_argument(
+        "--no_speech",
+        action="store_true",
+        help="Do not start the speech listener and handler threads."
+    )
+    parser.add_argument(
+        "--benchmark_model",
+        action="store_true",
+        help="Print per-module face model latency at startup."
+    )
     return parser.parse_args()
 
 def main():
@@ -34,6 +61,13 @@ def main():
     args = parse_arguments()
     Config.AUDIO_OUTPUT = args.audio_output
     Config.STT_PROVIDER = args.audio_input
+    Config.FACE_BENCHMARK_ON_STARTUP = args.benchmark_model
+    if args.camera_sources:
+        Config.CAMERA_SOURCES = args.camera_sources
+    logger.info(f"Camera sources: {Config.CAMERA_SOURCES}")
+    Config.HEADLESS = args.headless
+    Config.REPLAY_REALTIME = not args.fast
+    Config.SPEECH_ENABLED = not args.no_speech
     logger.info(f"Audio Output mode set to: {Config.AUDIO_OUTPUT}")
     logger.info(f"STT Provider set to: {Config.STT_PROVIDER}")
     
@@ -0,0 +1,75 @@
+import cv2
+import time
+import numpy as np
+from typing import Optional
+
+from logger import logger
+
+
+class MotionGate:
+    """
+    Cheap frame-differencing gate in front of face inference.
+    Frames are downscaled to a tiny grayscale thumbnail and compared with
+    the thumbnail of the last frame that went through inference; if too few
+    pixels changed the frame is skipped. A refresh is forced every
+    `refresh_sec` so visitor grace periods keep being fed.
+    """
+    def __init__(
+        self,
+        thumb_width: int = 64,
+        pixel_threshold: int = 25,
+        changed_fraction: float = 0.01,
+        refresh_sec: float = 5.0
+    ):
+        self.thumb_width = thumb_width
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.refresh_sec = refresh_sec
+        self._reference: Optional[np.ndarray] = None
+        self._last_run = 0.0
+        self.motion_detected = False  # Whether the last checked frame had real motion
+
+        # Stats
+        self.frames_run = 0
+        self.frames_skipped = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        size = (self.thumb_width, max(1, int(h * self.thumb_width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def _changed_fraction(self, thumb: np.ndarray) -> float:
+        if self._reference is None or self._reference.shape != thumb.shape:
+            return 1.0
+        diff = cv2.absdiff(thumb, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def should_run(self, frame: np.ndarray) -> bool:
+        """
+        Returns True if the frame should go through face inference and, if so,
+        makes it the new reference.
+        """
+        now = time.monotonic()
+        thumb = self._thumbnail(frame)
+        changed = self._changed_fraction(thumb) >= self.changed_fraction
+        self.motion_detected = changed and self._reference is not None
+
+        if changed or now - self._last_run >= self.refresh_sec:
+            self._reference = thumb
+            self._last_run = now
+            self.frames_run += 1
+            return True
+
+        self.frames_skipped += 1
+        return False
+
+    def log_stats(self):
+        total = self.frames_run + self.frames_skipped
+        pct = 100.0 * self.frames_skipped / total if total else 0.0
+        logger.info(
+            f"Motion gate: {self.frames_run} inference calls, "
+            f"{self.frames_skipped} skipped ({pct:.1f}%)"
+        )
@@ -0,0 +1,294 @@
+import cv2
+import threading
+from contextlib import nullcontext
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from logger import logger
+from capture import FrameRingBuffer, FrameSnapshot, CaptureThread
+from tracking import FaceTracker
+from motion import MotionGate
+from quality import build_quality_gate
+from unknowns import UnknownFaceStore
+from governor import FrameRateGovernor
+from utils import StageTimer
+from models.insightface_model import recognize_faces, detect_faces, embed_faces, draw_box
+
+
+class CameraPipeline:
+    """
+    Everything that belongs to one video source: its capture thread and
+    ring buffer, motion gate, tracker and the latest recognition results.
+    The face model and gallery are shared between pipelines; results are
+    reported to the owner through `on_detections(pipeline, detections)`.
+    """
+    def __init__(
+        self,
+        index: int,
+        source,
+        get_gallery: Callable,
+        on_detections: Callable,
+        timer: Optional[StageTimer] = None,
+        unknown_store: Optional[UnknownFaceStore] = None
+    ):
+        self.index = index
+        self.source = source
+        self.window_name = "Video Agent" if index == 0 else f"Video Agent [{index}] {source}"
+        self._get_gallery = get_gallery
+        self._on_detections = on_detections
+        self.timer = timer
+        self.unknown_store = unknown_store
+
+        self.governor = FrameRateGovernor(
+            active_fps=Config.GOVERNOR_ACTIVE_FPS,
+            idle_fps=Config.GOVERNOR_IDLE_FPS,
+            idle_after_sec=Config.GOVERNOR_IDLE_AFTER_SEC,
+            label=f" [{source}]",
+        ) if Config.GOVERNOR_ENABLED else None
+
+        self.frame_buffer = FrameRingBuffer(Config.FRAME_BUFFER_SIZE)
+        # Annotated newest frame for tools, rendered on the reader's thread
+        self.snapshot = FrameSnapshot(self.frame_buffer, self.annotate)
+        self.capture_thread = CaptureThread(
+            source,
+            self.frame_buffer,
+            width=Config.CAMERA_FRAME_WIDTH,
+            height=Config.CAMERA_FRAME_HEIGHT,
+            realtime=Config.REPLAY_REALTIME,
+            timer=timer,
+            governor=self.governor,
+            name=f"Capture-{index}"
+        )
+        self.tracker = FaceTracker(
+            Config.DETECT_EVERY_N_FRAMES,
+            confirm_threshold=Config.TRACK_CONFIRM_THRESHOLD,
+            reverify_sec=Config.TRACK_REVERIFY_SEC,
+        ) if Config.TRACKING_ENABLED else None
+        self.motion_gate = MotionGate(
+            pixel_threshold=Config.MOTION_PIXEL_THRESHOLD,
+            changed_fraction=Config.MOTION_CHANGED_FRACTION,
+            refresh_sec=Config.MOTION_REFRESH_SEC,
+        ) if Config.MOTION_GATE_ENABLED else None
+        self.quality_gate = build_quality_gate()
+
+        self.latest_detections = []
+        self.detections_lock = threading.Lock()
+        self.seq = 0  # Last frame sequence consumed by inference
+        self.frames_processed = 0
+        self._busy = False  # A consumed frame has not been published yet
+        self.inference_thread: Optional[threading.Thread] = None
+
+    # --- Lifecycle ---
+
+    def start_capture(self) -> bool:
+        self.capture_thread.start()
+        return self.capture_thread.wait_until_ready()
+
+    def start_inference(self, stop_event: threading.Event):
+        """Runs in-process inference for this source on its own thread."""
+        self.inference_thread = threading.Thread(
+            target=self.inference_loop,
+            args=(stop_event,),
+            daemon=True,
+            name=f"FaceInference-{self.index}"
+        )
+        self.inference_thread.start()
+
+    def _stage(self, name: str):
+        return self.timer.stage(name) if self.timer is not None else nullcontext()
+
+    def is_finished(self) -> bool:
+        """True once a file source hit EOF and its last frame was consumed."""
+        return (
+            self.capture_thread.finished.is_set()
+            and self.seq >= self.frame_buffer.seq
+            and not self._busy
+        )
+
+    def stop(self):
+        self.capture_thread.stop()
+        if self.capture_thread.is_alive():
+            self.capture_thread.join(timeout=2)
+        if self.inference_thread is not None and self.inference_thread.is_alive():
+            self.inference_thread.join(timeout=2)
+
+    def log_stats(self):
+        logger.info(
+            f"[{self.source}] Frames: {self.capture_thread.frames_captured} captured, "
+            f"{self.frames_processed} processed, {self.frame_buffer.dropped} dropped before processing"
+        )
+        if self.motion_gate is not None:
+            self.motion_gate.log_stats()
+        if self.quality_gate is not None:
+            self.quality_gate.log_stats(f"[{self.source}] ")
+        if self.governor is not None:
+            logger.info(
+                f"[{self.source}] Governor: mode={self.governor.mode}, "
+                f"{self.governor.transitions} mode changes"
+            )
+        if self.tracker is not None:
+            logger.info(
+                f"[{self.source}] Tracking: {self.tracker.detections_run} full detections, "
+                f"{self.tracker.frames_tracked} frames tracked by optical flow"
+            )
+            logger.info(
+                f"[{self.source}] Identity cache: {self.tracker.embeddings_computed} embeddings computed, "
+                f"{self.tracker.embeddings_saved} skipped for confirmed tracks"
+            )
+
+    # --- Inference ---
+
+    def next_frame(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """Returns the newest frame not yet consumed by inference, or None."""
+        seq, frame = self.frame_buffer.wait_newer(self.seq, timeout=timeout)
+        if frame is not None:
+            self.frames_processed += 1
+            # Busy before the new seq is visible, so is_finished() never sees the frame as done
+            self._busy = True
+        self.seq = seq
+        return frame
+
+    def should_infer(self, frame: np.ndarray) -> bool:
+        if self.motion_gate is None:
+            return True
+        with self._stage("motion_gate"):
+            run = self.motion_gate.should_run(frame)
+        if self.governor is not None and self.motion_gate.motion_detected:
+            self.governor.report_activity("motion")
+        return run
+
+    def inference_loop(self, stop_event: threading.Event):
+        """
+        Consumes the newest captured frame, runs face recognition and reports
+        the result. Runs at whatever rate inference allows; frames that
+        arrive while it is busy are skipped rather than queued.
+        """
+        while not stop_event.is_set():
+            frame = self.next_frame(timeout=0.5)
+            if frame is None:
+                continue
+
+            # Face Recognition (static scenes reuse the previous result)
+            if not self.should_infer(frame):
+                self.reuse_previous()
+                continue
+            try:
+                detections = self.recognize(frame)
+            except Exception as e:
+                logger.error(f"Face recognition error: {e}")
+                detections = []
+            self.publish(detections)
+
+    def reuse_previous(self):
+        with self.detections_lock:
+            detections = self.latest_detections
+        self.publish(detections)
+
+    def publish(self, detections: List):
+        """Makes detections visible to the display loop and reports them."""
+        with self.detections_lock:
+            self.latest_detections = detections
+        if detections and self.governor is not None:
+            self.governor.report_activity("face")
+        self._on_detections(self, detections)
+        self._busy = False
+
+    def passes_quality(self, frame: np.ndarray, faces: List) -> List[bool]:
+        """Quality gate flags per face; rejected faces skip the recognition model."""
+        if self.quality_gate is None:
+            return [True] * len(faces)
+        with self._stage("quality"):
+            return self.quality_gate.filter(frame, faces)
+
+    def identify(self, frame: np.ndarray, faces: List) -> List[Tuple[str, float]]:
+        """Embeds the faces and returns (name, sim) for each against the current gallery."""
+        with self._stage("embed"):
+            embed_faces(frame, faces)
+        with self._stage("match"):
+            matches = recognize_faces(
+                faces, self._get_gallery(), Config.FACE_RECOG_THRESHOLD, Config.FACE_RECOG_TOP_K
+            )
+        names = self.label_unknowns(faces, [top_names[0] for top_names, _ in matches])
+        return [(name, top_sims[0]) for name, (_, top_sims) in zip(names, matches)]
+
+    def label_unknowns(self, faces: List, names: List[str]) -> List[str]:
+        """Replaces "Unknown" with a provisional ID from the unknown-face store."""
+        if self.unknown_store is None:
+            return names
+        unknown = [i for i, (face, name) in enumerate(zip(faces, names)) if name == "Unknown" and face.embedding is not None]
+        if not unknown:
+            return names
+        with self._stage("unknowns"):
+            ids = self.unknown_store.assign(np.stack([faces[i].normed_embedding for i in unknown]))
+        names = list(names)
+        for i, provisional_id in zip(unknown, ids):
+            names[i] = provisional_id
+        return names
+
+    def recognize(self, frame: np.ndarray) -> List:
+        """
+        Returns (face_or_track, name, sim) for every face in the frame.
+        In tracking mode the full detection + embedding pipeline only runs
+        every N frames (or when a track is lost); in between, boxes are
+        propagated by optical flow and each track keeps its cached identity.
+        Faces rejected by the quality gate are reported as "Unknown" (or keep
+        their track's identity) without being embedded; other unmatched
+        faces get a provisional unknown-N ID when the unknown store is enabled.
+        """
+        if self.tracker is None:
+            with self._stage("detect"):
+                faces = detect_faces(frame)
+            passed = self.passes_quality(frame, faces)
+            identities = iter(self.identify(frame, [face for face, ok in zip(faces, passed) if ok]))
+            return [
+                (face, *next(identities)) if ok else (face, "Unknown", 0.0)
+                for face, ok in zip(faces, passed)
+            ]
+
+        if not self.tracker.should_detect():
+            with self._stage("track"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                tracks = self.tracker.propagate(gray)
+            return [(t, t.name, t.sim) for t in tracks]
+
+        # Detection only; the recognition model runs just for new, unconfirmed
+        # or re-verification-due tracks. Confirmed tracks keep their identity.
+        with self._stage("detect"):
+            faces = detect_faces(frame)
+        matched = self.tracker.associate([face.bbox for face in faces])
+        needed = [self.tracker.needs_embedding(track) for track in matched]
+        candidates = [face for face, fresh in zip(faces, needed) if fresh]
+        passed = iter(self.passes_quality(frame, candidates))
+        verified = [fresh and next(passed) for fresh in needed]
+        to_embed = [face for face, fresh in zip(faces, verified) if fresh]
+        identities = iter(self.identify(frame, to_embed))
+        # Only confirmed tracks count as saved; gate rejections are the quality gate's stats
+        saved = sum(1 for track, fresh in zip(matched, needed) if track is not None and not fresh)
+        self.tracker.record_embeddings(len(to_embed), saved)
+
+        detections = []
+        for face, track, fresh in zip(faces, matched, verified):
+            if fresh:
+                detections.append((face.bbox, *next(identities)))
+            elif track is not None:
+                detections.append((face.bbox, track.name, track.sim))
+            else:
+                detections.append((face.bbox, "Unknown", 0.0))
+
+        with self._stage("track"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            tracks = self.tracker.update(gray, detections, matched, verified)
+        return [(t, t.name, t.sim) for t in tracks]
+
+    # --- Display ---
+
+    def annotate(self, frame: np.ndarray) -> np.ndarray:
+        """Returns a copy of the frame with the latest results drawn on it."""
+        frame = frame.copy()
+        with self.detections_lock:
+            detections = list(self.latest_detections)
+        for face, name, sim in detections:
+            frame = draw_box(face, name, sim, frame)
+        return frame
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+from typing import List, Optional
+
+from config import Config
+from logger import logger
+
+
+class FaceQualityGate:
+    """
+    Rejects faces that would almost certainly come back "Unknown" before the
+    recognition model runs: low detector confidence, too small, turned too
+    far sideways (from the 5-point landmarks) or too blurry (variance of the
+    Laplacian of a small grayscale crop). Checks run cheapest first.
+    """
+    REASONS = ("score", "size", "pose", "blur")
+
+    def __init__(
+        self,
+        min_size: int = 40,
+        min_det_score: float = 0.6,
+        max_yaw: float = 0.6,
+        min_sharpness: float = 20.0,
+        crop_size: int = 64
+    ):
+        self.min_size = min_size
+        self.min_det_score = min_det_score
+        self.max_yaw = max_yaw
+        self.min_sharpness = min_sharpness
+        self.crop_size = crop_size
+
+        # Stats
+        self.faces_passed = 0
+        self.faces_rejected = {reason: 0 for reason in self.REASONS}
+
+    @staticmethod
+    def yaw_ratio(kps: np.ndarray) -> float:
+        """
+        Horizontal offset of the nose from the midpoint between the eyes,
+        relative to the eye distance: ~0 for a frontal face, growing as the
+        head turns. kps are InsightFace's 5 landmarks (eyes, nose, mouth corners).
+        """
+        left_eye, right_eye, nose = kps[0], kps[1], kps[2]
+        eye_dist = max(abs(right_eye[0] - left_eye[0]), 1.0)
+        return float(abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_dist)
+
+    def sharpness(self, frame: np.ndarray, bbox: np.ndarray) -> float:
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = bbox.astype(int)
+        x1, y1, x2, y2 = max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)
+        if x2 <= x1 or y2 <= y1:
+            return 0.0
+        crop = cv2.resize(frame[y1:y2, x1:x2], (self.crop_size, self.crop_size), interpolation=cv2.INTER_AREA)
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        return float(cv2.Laplacian(crop, cv2.CV_32F).var())
+
+    def check(self, frame: np.ndarray, face) -> Optional[str]:
+        """Returns the rejection reason, or None if the face should be embedded."""
+        if face.det_score is not None and face.det_score < self.min_det_score:
+            return "score"
+        x1, y1, x2, y2 = face.bbox
+        if min(x2 - x1, y2 - y1) < self.min_size:
+            return "size"
+        if face.kps is not None and self.yaw_ratio(face.kps) > self.max_yaw:
+            return "pose"
+        if self.sharpness(frame, face.bbox) < self.min_sharpness:
+            return "blur"
+        return None
+
+    def filter(self, frame: np.ndarray, faces: List) -> List[bool]:
+        """Returns a pass/reject flag per face and updates the counters."""
+        passed = []
+        for face in faces:
+            reason = self.check(frame, face)
+            if reason is None:
+                self.faces_passed += 1
+            else:
+                self.faces_rejected[reason] += 1
+            passed.append(reason is None)
+        return passed
+
+    @property
+    def total_rejected(self) -> int:
+        return sum(self.faces_rejected.values())
+
+    def log_stats(self, label: str = ""):
+        total = self.faces_passed + self.total_rejected
+        pct = 100.0 * self.total_rejected / total if total else 0.0
+        reasons = ", ".join(f"{reason}={count}" for reason, count in self.faces_rejected.items())
+        logger.info(
+            f"{label}Quality gate: {self.faces_passed} faces embedded, "
+            f"{self.total_rejected} skipped ({pct:.1f}%; {reasons})"
+        )
+
+
+def build_quality_gate() -> Optional[FaceQualityGate]:
+    """The gate configured in Config, or None when gating is disabled."""
+    if not Config.FACE_QUALITY_GATE_ENABLED:
+        return None
+    return FaceQualityGate(
+        min_size=Config.FACE_QUALITY_MIN_SIZE,
+        min_det_score=Config.FACE_QUALITY_MIN_DET_SCORE,
+        max_yaw=Config.FACE_QUALITY_MAX_YAW,
+        min_sharpness=Config.FACE_QUALITY_MIN_SHARPNESS,
+    )
@@ -4,12 +4,16 @@ import time
 from datetime import datetime
 from queue import Queue
 from threading import Event
+from typing import Callable, List, Optional
 
 from langchain.agents import create_openai_functions_agent, AgentExecutor
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
 
 from tool_calling import get_tools
+from item_writer import ItemWriter
+from capture import FrameSnapshot
+from visitor_history import Session
 from notifier import notify
 from utils import compute_latency
 from logger import logger
@@ -18,8 +22,9 @@ from config import Config
 def handle_speech_input(
     audio_queue: Queue, 
     pause_listener_event: Event, 
-    frame_request_queue: Queue, 
-    frame_response_queue: Queue
+    frame_snapshot: Callable[[], Optional[FrameSnapshot]],
+    item_writer: ItemWriter,
+    open_sessions: Callable[[], List[Session]]
 ):
     """
     Processes recognized speech using an LLM agent.
@@ -29,7 +34,7 @@ def handle_speech_input(
         return
 
     # Initialize generic tools
-    tools = get_tools(frame_request_queue, frame_response_queue)
+    tools = get_tools(frame_snapshot, item_writer, open_sessions)
 
     # Initialize LLM
     llm = ChatOpenAI(
@@ -0,0 +1,80 @@
+import pytest
+
+from database import ItemDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = ItemDatabase(tmp_path / "items.db")
+    yield db
+    db.close()
+
+
+def add_items(db, rows):
+    return db.log_items([(name, place, f"{name}.jpg", description) for name, place, description in rows])
+
+
+def test_search_ranks_item_name_matches_first(db):
+    if not db.fts_enabled:
+        pytest.skip("SQLite built without FTS5")
+    add_items(db, [
+        ("notebook", "desk", "next to my keys"),
+        ("keys", "hallway", ""),
+        ("umbrella", "keys hook", ""),
+        ("wallet", "kitchen", ""),
+    ])
+
+    results = db.search_items("keys")
+    assert [row[1] for row in results] == ["keys", "umbrella", "notebook"]
+
+
+def test_search_matches_word_prefixes(db):
+    if not db.fts_enabled:
+        pytest.skip("SQLite built without FTS5")
+    add_items(db, [("pencil", "desk", ""), ("wallet", "kitchen", "")])
+
+    assert [row[1] for row in db.search_items("pen")] == ["pencil"]
+
+
+def test_search_without_match_returns_recent_items(db):
+    add_items(db, [(f"item{i}", "shelf", "") for i in range(8)])
+
+    results = db.search_items("giraffe")
+    assert [row[1] for row in results] == ["item7", "item6", "item5", "item4", "item3"]
+
+
+def test_pages_cover_every_item_once(db):
+    # Inserted in one batch, so they share a timestamp and only the id breaks ties
+    ids = add_items(db, [(f"item{i}", "shelf", "") for i in range(23)])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = db.get_items_page(5, cursor)
+        seen.extend(row[0] for row in rows)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert seen == sorted(ids, reverse=True)
+    assert pages == 5
+    assert list(row[0] for row in db.iter_items(page_size=4)) == seen
+
+
+def test_pages_are_stable_when_items_are_deleted(db):
+    ids = add_items(db, [(f"item{i}", "shelf", "") for i in range(12)])
+    newest_first = sorted(ids, reverse=True)
+
+    first, cursor = db.get_items_page(4)
+    assert [row[0] for row in first] == newest_first[:4]
+
+    # Deleting already-seen and not-yet-seen rows must neither skip nor repeat items
+    db.delete_item(newest_first[0])
+    db.delete_item(newest_first[5])
+
+    rest = []
+    while cursor is not None:
+        rows, cursor = db.get_items_page(4, cursor)
+        rest.extend(row[0] for row in rows)
+
+    assert rest == newest_first[4:5] + newest_first[6:]
+    assert db.count_items() == 10
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from gallery import exact_search
+from gallery_index import INDEX_FILE, IVFIndex
+
+
+@pytest.fixture(scope="module")
+def clustered():
+    """Templates grouped around a few hundred identities, like a real face gallery, plus noisy probes."""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((200, 512)).astype(np.float32)
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    members = rng.integers(0, len(centers), 4000)
+    embeddings = centers[members] + 0.05 * rng.standard_normal((4000, 512)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    truth = rng.choice(len(embeddings), 200, replace=False)
+    queries = embeddings[truth] + 0.03 * rng.standard_normal((200, 512)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return embeddings.astype(np.float32), queries.astype(np.float32)
+
+
+def recall_at_1(index, embeddings, queries):
+    expected, _ = exact_search(embeddings, queries, 1)
+    found, _ = index.search(queries, 1)
+    return float(np.mean(found[:, 0] == expected[:, 0]))
+
+
+def test_probing_every_list_is_exact(clustered):
+    embeddings, queries = clustered
+    index = IVFIndex.build(embeddings, n_lists=32)
+    index.n_probe = index.n_lists
+
+    expected_idx, expected_scores = exact_search(embeddings, queries, 5)
+    idx, scores = index.search(queries, 5)
+    np.testing.assert_allclose(scores, expected_scores, atol=1e-5)
+    assert np.mean(idx == expected_idx) > 0.99
+
+
+def test_recall_against_exact_search(clustered):
+    embeddings, queries = clustered
+    index = IVFIndex.build(embeddings, n_lists=64, n_probe=8)
+    assert recall_at_1(index, embeddings, queries) >= 0.95
+
+
+def test_saved_index_matches_built_index(clustered, tmp_path):
+    embeddings, queries = clustered
+    index = IVFIndex.build(embeddings, n_lists=64, n_probe=8)
+    index.save(tmp_path / INDEX_FILE, generation=3)
+
+    loaded = IVFIndex.load(tmp_path / INDEX_FILE, embeddings, generation=3, n_probe=8)
+    assert isinstance(loaded.grouped, np.memmap)
+    np.testing.assert_array_equal(loaded.search(queries, 5)[0], index.search(queries, 5)[0])
+
+    # An index from another gallery generation is not reused
+    assert IVFIndex.load(tmp_path / INDEX_FILE, embeddings, generation=4, n_probe=8) is None
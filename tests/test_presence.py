@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from update_visitors import PresenceTracker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_tracker(grace: float = 10.0):
+    clock, sessions = FakeClock(), []
+    tracker = PresenceTracker(grace, lambda *session: sessions.append(session), clock=clock)
+    return tracker, clock, sessions
+
+
+def test_departure_after_grace_period():
+    tracker, clock, sessions = make_tracker()
+    tracker.observe(["alice"])
+    clock.now = 5.0
+    tracker.observe(["alice"])
+
+    clock.now = 14.0
+    tracker.tick()
+    assert sessions == []
+
+    clock.now = 15.0
+    tracker.tick()
+    assert len(sessions) == 1
+    name, arrived_at, left_at = sessions[0]
+    assert name == "alice"
+    # The visit ends when alice was last seen, not when the grace period ran out
+    assert left_at - arrived_at == timedelta(seconds=5)
+    assert tracker.active == {}
+
+
+def test_reappearing_visitor_extends_visit():
+    tracker, clock, sessions = make_tracker()
+    tracker.observe(["alice", "bob"])
+    for t in (8.0, 16.0, 24.0):
+        clock.now = t
+        tracker.observe(["alice"])
+
+    assert [s[0] for s in sessions] == ["bob"]
+    assert set(tracker.active) == {"alice"}
+
+    clock.now = 34.0
+    tracker.tick()
+    assert [s[0] for s in sessions] == ["bob", "alice"]
+    assert sessions[1][2] - sessions[1][1] == timedelta(seconds=24)
+
+
+def test_unknown_faces_are_not_visitors():
+    tracker, clock, sessions = make_tracker()
+    tracker.observe(["Unknown"])
+    assert tracker.active == {}
+    assert tracker.open_sessions() == []
+
+
+def test_open_sessions_report_visits_in_progress():
+    tracker, clock, sessions = make_tracker()
+    tracker.observe(["alice"])
+    assert [s[0] for s in tracker.open_sessions()] == ["alice"]
+    assert sessions == []
+
+
+def test_flush_ends_every_open_visit():
+    tracker, clock, sessions = make_tracker()
+    tracker.observe(["alice", "bob"])
+    clock.now = 3.0
+    tracker.observe(["bob"])
+
+    tracker.flush()
+    assert sorted(s[0] for s in sessions) == ["alice", "bob"]
+    assert tracker.active == {}
+
+    # Stale heap entries must not log the visitors a second time
+    clock.now = 100.0
+    tracker.tick()
+    assert len(sessions) == 2
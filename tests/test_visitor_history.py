@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from visitor_history import VisitorHistory
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = VisitorHistory(tmp_path / "visitors.db")
+    yield history
+    history.close()
+
+
+def write_log(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def record(visitor, day, arrived, left):
+    return json.dumps({"visitor": visitor, "Timestamp": day, "from": arrived, "to": left})
+
+
+def test_import_jsonl_handles_visits_past_midnight(history, tmp_path):
+    log = write_log(tmp_path / "visitor_log.txt", [
+        record("alice", "2024-03-01", "09:00:00", "09:30:00"),
+        record("bob", "2024-03-01", "23:50:00", "00:10:00"),
+    ])
+
+    assert history.import_jsonl(log) == 2
+    assert history.sessions(visitor="bob") == [("bob", "2024-03-01 23:50:00", "2024-03-02 00:10:00")]
+    assert history.sessions(visitor="alice") == [("alice", "2024-03-01 09:00:00", "2024-03-01 09:30:00")]
+
+
+def test_import_jsonl_skips_malformed_lines(history, tmp_path):
+    log = write_log(tmp_path / "visitor_log.txt", [
+        record("alice", "2024-03-01", "09:00:00", "09:30:00"),
+        "{not json",
+        json.dumps({"visitor": "carol", "Timestamp": "2024-03-01"}),
+        record("dave", "2024-03-01", "noon", "13:00:00"),
+        "",
+        record("bob", "2024-03-02", "10:00:00", "10:05:00"),
+    ])
+
+    assert history.import_jsonl(log) == 2
+    assert sorted(history.visitors()) == ["alice", "bob"]
+
+
+def test_import_jsonl_runs_once_per_file(history, tmp_path):
+    log = write_log(tmp_path / "visitor_log.txt", [
+        record("alice", "2024-03-01", "09:00:00", "09:30:00"),
+    ])
+
+    assert history.import_jsonl(log) == 1
+    assert history.import_jsonl(log) == 0
+    assert len(history.sessions()) == 1
+
+
+def test_import_jsonl_missing_file(history, tmp_path):
+    assert history.import_jsonl(tmp_path / "missing.txt") == 0
@@ -1,19 +1,20 @@
 
-import cv2
 import time
-from datetime import datetime
-from threading import Event
-from queue import Queue
+from datetime import datetime, timedelta
+from threading import Event, Thread
 from functools import partial
-from typing import Optional, Type
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, Type
 
-from langchain.agents import Tool
 from langchain.tools import StructuredTool
 from langchain.pydantic_v1 import BaseModel, Field
 
 from config import Config
 from logger import logger
+from capture import FrameSnapshot
 from database import ItemDatabase
+from item_writer import ItemWriter
+from visitor_history import TIME_FORMAT, Session, VisitorHistory
 
 # --- Input Models ---
 
@@ -24,80 +25,244 @@ class StoreItemInput(BaseModel):
 class RetrieveItemInput(BaseModel):
     item_name: str = Field(description="Name of the item to find")
 
+class VisitorLogInput(BaseModel):
+    aggregation: str = Field(
+        default="summary",
+        description="'summary' (number of visits and total time per person), 'sessions' (individual visits), "
+                    "'first_last' (when each person was first and last seen) or 'present_at' (who was in the room at a given time)"
+    )
+    start_date: Optional[str] = Field(default=None, description="First day to include: YYYY-MM-DD, 'today' or 'yesterday'. Omit for all history.")
+    end_date: Optional[str] = Field(default=None, description="Last day to include: YYYY-MM-DD, 'today' or 'yesterday'. Omit for no end.")
+    person: Optional[str] = Field(default=None, description="Only this visitor's name")
+    at: Optional[str] = Field(default=None, description="For present_at: 'YYYY-MM-DD HH:MM' or 'HH:MM' (today)")
+
 class ListItemsInput(BaseModel):
     query: str = Field(default="all", description="Query filter for items")
     visual: bool = Field(default=False, description="Whether to show items in the interactive viewer")
 
 # --- Tool Functions ---
 
-def get_visitor_log(query: str) -> str:
-    """Reads the visitor log file."""
-    logger.info(f"Tool called: get_visitor_log with query='{query}'")
+def _parse_day(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return None
+    text = text.strip().lower()
+    if text == "today":
+        return datetime.now().strftime("%Y-%m-%d")
+    if text == "yesterday":
+        return (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+
+def _parse_moment(text: Optional[str]) -> datetime:
+    if not text:
+        return datetime.now()
+    text = text.strip()
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    clock = datetime.strptime(text, "%H:%M")
+    return datetime.now().replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+
+def _format_duration(seconds: float) -> str:
+    minutes = int(round(seconds / 60))
+    return f"{minutes // 60}h {minutes % 60:02d}m" if minutes >= 60 else f"{minutes}m"
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English/JSON)."""
+    return max(1, len(text) // 4)
+
+def _open_rows(
+    open_sessions: List[Session],
+    start: Optional[str],
+    end: Optional[str],
+    person: Optional[str]
+) -> List[Tuple[str, str, str]]:
+    """Visits in progress as (visitor, arrived_at, now) text rows, filtered like VisitorHistory queries."""
+    rows = []
+    for visitor, arrived, now in open_sessions:
+        day = arrived.strftime("%Y-%m-%d")
+        if (start and day < start) or (end and day > end) or (person and visitor != person):
+            continue
+        rows.append((visitor, arrived.strftime(TIME_FORMAT), now.strftime(TIME_FORMAT)))
+    return rows
+
+def _with_open_visits(rows: List[Tuple], open_rows: List[Tuple[str, str, str]]) -> List[Tuple]:
+    """Adds visits in progress to dwell_summary rows (visitor, visits, dwell, first, last)."""
+    merged = {row[0]: list(row) for row in rows}
+    for visitor, arrived_at, now in open_rows:
+        dwell = (datetime.strptime(now, TIME_FORMAT) - datetime.strptime(arrived_at, TIME_FORMAT)).total_seconds()
+        row = merged.setdefault(visitor, [visitor, 0, 0.0, arrived_at, now])
+        row[1] += 1
+        row[2] += dwell
+        row[3] = min(row[3], arrived_at)
+        row[4] = max(row[4], now)
+    return sorted((tuple(row) for row in merged.values()), key=lambda row: (-row[1], row[0]))
+
+def _visitor_log_answer(
+    history: VisitorHistory,
+    aggregation: str,
+    start: Optional[str],
+    end: Optional[str],
+    person: Optional[str],
+    at: Optional[str],
+    open_sessions: Optional[List[Session]] = None
+) -> str:
+    open_sessions = open_sessions or []
+    if person:
+        # Names come from the LLM; match them case-insensitively
+        match = history.find_visitor(person) or next(
+            (visitor for visitor, _, _ in open_sessions if visitor.lower() == person.strip().lower()), None
+        )
+        if match is None:
+            return f"No visits recorded for {person}."
+        person = match
+    window = f" between {start or 'the beginning'} and {end or 'now'}" if start or end else ""
+    # Visits in progress are only in the presence tracker until the visitor leaves
+    open_rows = _open_rows(open_sessions, start, end, person)
+
+    if aggregation == "present_at":
+        moment = _parse_moment(at)
+        t = moment.strftime(TIME_FORMAT)
+        sessions = [row for row in history.present_at(moment) if person is None or row[0] == person]
+        current = [row for row in _open_rows(open_sessions, None, None, person) if row[1] <= t]
+        if not sessions and not current:
+            return f"Nobody was present at {moment:%Y-%m-%d %H:%M}."
+        return f"Present at {moment:%Y-%m-%d %H:%M}: " + "; ".join(
+            [f"{visitor} ({arrived_at[11:16]}-{left_at[11:16]})" for visitor, arrived_at, left_at in sessions]
+            + [f"{visitor} (since {arrived_at[11:16]}, still here)" for visitor, arrived_at, _ in current]
+        )
+
+    if aggregation == "sessions":
+        sessions = history.sessions(start, end, person, limit=Config.VISITOR_LOG_TOOL_LIMIT)
+        if not sessions and not open_rows:
+            return f"No visits recorded{window}."
+        lines = [f"{visitor}: {arrived_at[:16]} to {left_at[11:16]}" for visitor, arrived_at, left_at in reversed(sessions)]
+        lines += [f"{visitor}: {arrived_at[:16]} to now (still here)" for visitor, arrived_at, _ in sorted(open_rows, key=lambda r: r[1])]
+        if len(sessions) == Config.VISITOR_LOG_TOOL_LIMIT:
+            lines.insert(0, f"(latest {len(sessions)} visits{window})")
+        return "\n".join(lines)
+
+    if aggregation == "first_last":
+        rows = _with_open_visits(history.dwell_summary(start, end, person), open_rows)
+        if not rows:
+            return f"No visits recorded{window}."
+        return "\n".join(
+            f"{visitor}: first seen {first[:16]}, last seen {last[:16]}" for visitor, _, _, first, last in rows
+        )
+
+    if aggregation != "summary":
+        return f"Unknown aggregation '{aggregation}'. Use summary, sessions, first_last or present_at."
+    rows = _with_open_visits(history.dwell_summary(start, end, person), open_rows)
+    if not rows:
+        return f"No visits recorded{window}."
+    return f"Visits{window}:\n" + "\n".join(
+        f"{visitor}: {visits} visit{'s' if visits != 1 else ''}, {_format_duration(dwell)} in total"
+        for visitor, visits, dwell, _, _ in rows
+    )
+
+def get_visitor_log(
+    aggregation: str = "summary",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    person: Optional[str] = None,
+    at: Optional[str] = None,
+    history: VisitorHistory = None,
+    open_sessions: Optional[Callable[[], List[Session]]] = None
+) -> str:
+    """
+    Answers visitor questions from the visitor history with a compact,
+    locally computed result instead of the raw log. Logs the response time
+    and the tokens saved against sending the whole log.
+    """
+    logger.info(
+        f"Tool called: get_visitor_log aggregation='{aggregation}', start='{start_date}', "
+        f"end='{end_date}', person='{person}', at='{at}'"
+    )
+    started = time.perf_counter()
     try:
-        if not Config.VISITOR_LOG_PATH.exists():
-            return "No visitor log found."
-        
-        with open(Config.VISITOR_LOG_PATH, "r") as f:
-            logs = f.read()
-        return logs if logs else "The visitor log is empty."
+        answer = _visitor_log_answer(
+            history, aggregation.strip().lower(), _parse_day(start_date), _parse_day(end_date), person, at,
+            open_sessions() if open_sessions is not None else None
+        )
+    except ValueError as e:
+        return f"Could not understand the date or time: {e}"
     except Exception as e:
         logger.error(f"Error reading visitor log: {e}")
         return f"Error reading visitor log: {e}"
 
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    tokens = _estimate_tokens(answer)
+    _, raw_chars = history.raw_log_size()
+    raw_tokens = max(1, raw_chars // 4)
+    saved = 100.0 * (1 - tokens / raw_tokens) if raw_tokens > tokens else 0.0
+    logger.info(
+        f"GetVisitorLog ({aggregation}): ~{tokens} tokens returned vs ~{raw_tokens} for the raw log "
+        f"({saved:.0f}% saved), {elapsed_ms:.1f} ms"
+    )
+    return answer
+
 def answer_general_question(query: str) -> str:
     """Placeholder for general questions."""
     logger.info(f"Tool called: answer_general_question with query='{query}'")
     return f"I heard your question: '{query}', but I can only answer visitor log related queries for now."
 
+def _report_item_write(future: Future, item_name: str, place_name: str):
+    """Speaks up if an item that was already confirmed could not be saved."""
+    try:
+        future.result()
+    except Exception as e:
+        logger.error(f"Failed to store '{item_name}' in '{place_name}': {e}")
+        # notify blocks while speaking; keep it off the writer thread
+        Thread(
+            target=notify,
+            args=(f"Sorry, I couldn't save the {item_name} in the {place_name}. Please try again.",),
+            daemon=True
+        ).start()
+
 def store_item_location_structured(
     item_name: str, 
     place_name: str, 
-    frame_request_queue: Queue, 
-    frame_response_queue: Queue,
-    db: ItemDatabase
+    frame_snapshot: Callable[[], Optional[FrameSnapshot]],
+    writer: ItemWriter
 ) -> str:
-    """Stores item location with an image capture."""
+    """
+    Stores item location with an image capture. The image and row are
+    written by the background ItemWriter, so this confirms right after
+    capturing; a failed write is announced when it happens.
+    """
     logger.info(f"Tool called: store_item_location for item='{item_name}' at place='{place_name}'")
     
-    # Request frame
-    frame_request_queue.put("CAPTURE")
-    try:
-        frame = frame_response_queue.get(timeout=3)
-    except Exception:
+    # Newest annotated frame of the primary camera, without waiting on the video loop
+    snapshot = frame_snapshot()
+    _, frame = snapshot.frame() if snapshot is not None else (0, None)
+    if frame is None:
         return "Failed to capture image for item storage."
 
-    # Save image
     timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
     image_filename = f"{item_name}_{timestamp_str}.jpg"
     image_path = Config.ITEM_FRAMES_DIR / image_filename
-    
-    try:
-        cv2.imwrite(str(image_path), frame)
-    except Exception as e:
-        logger.error(f"Failed to save item image: {e}")
-        return "Failed to save item image."
 
-    # Log to DB
-    success = db.log_item(item_name, place_name, str(image_path))
-    
-    if success:
-        return f"Stored '{item_name}' in '{place_name}' with image captured at {timestamp_str}."
-    else:
-        return f"Failed to log '{item_name}' to database."
+    future = writer.submit(item_name, place_name, frame, image_path)
+    if future.done() and future.exception() is not None:
+        return f"Failed to store '{item_name}': {future.exception()}"
+    future.add_done_callback(lambda f: _report_item_write(f, item_name, place_name))
+    return f"Stored '{item_name}' in '{place_name}' with image captured at {timestamp_str}."
 
 import subprocess
 import sys
 from notifier import notify
 
-def _launch_viewer(results: list, item_name: str) -> str:
-    """Helper to launch viewer for a list of database results."""
-    count = len(results)
+def _launch_viewer(results: list, item_name: str, total: int = None) -> str:
+    """
+    Helper to launch viewer for a list of database results. When `total` is
+    given, `results` is just the first page of the whole item history: the
+    viewer pages through everything itself and only that page is summarized.
+    """
+    count = len(results) if total is None else total
     if count == 0:
         return f"No items found for '{item_name}'."
 
-    # Extract IDs for viewer
-    item_ids = [str(r[0]) for r in results]
-    
     # Speak immediately before blocking
     if item_name == "all items":
         msg = f"I found {count} items in total. Opening the viewer for you."
@@ -109,10 +274,17 @@ def _launch_viewer(results: list, item_name: str) -> str:
     
     try:
         viewer_script = Config.ROOT_DIR / "view_items.py"
-        logger.info(f"Launching viewer for IDs: {item_ids}")
+        if total is None:
+            # Extract IDs for viewer
+            item_ids = [str(r[0]) for r in results]
+            viewer_args = ["--ids"] + item_ids
+            logger.info(f"Launching viewer for IDs: {item_ids}")
+        else:
+            viewer_args = ["--all"]
+            logger.info(f"Launching viewer for all {total} items")
         
         result = subprocess.run(
-            [sys.executable, str(viewer_script), "--ids"] + item_ids,
+            [sys.executable, str(viewer_script)] + viewer_args,
             check=False,
             capture_output=True,
             text=True
@@ -133,6 +305,8 @@ def _launch_viewer(results: list, item_name: str) -> str:
         return f"Found {count} items, but failed to open viewer: {e}"
         
     items_summary = ", ".join([f"'{r[1]}' at '{r[2]}'" for r in results])
+    if count > len(results):
+        items_summary += f" (the {len(results)} most recent; {count - len(results)} older items not listed)"
     
     if deleted_count > 0:
         return f"User finished using the interactive viewer. They viewed {count} items: {items_summary}. IMPORTANT: They deleted {deleted_count} items. Briefly acknowledge the deletions. DO NOT list the remaining items again."
@@ -142,42 +316,53 @@ def _launch_viewer(results: list, item_name: str) -> str:
 def retrieve_item_location(item_name: str, db: ItemDatabase) -> str:
     """Finds item location via smart search and launches viewer."""
     logger.info(f"Tool called: retrieve_item_location for item='{item_name}'")
-    results = db.search_items(item_name)
+    results = db.search_items(item_name, limit=Config.ITEM_PAGE_SIZE)
     if not results:
-        return f"No items found for '{item_name}' (checked exact match, keywords, and recent items)."
+        return f"No items matched '{item_name}'."
     return _launch_viewer(results, item_name)
 
 def list_all_items(query: str = "all", db: ItemDatabase = None, visual: bool = True) -> str:
     """Lists stored items. Launches the interactive viewer by default."""
     logger.info(f"Tool called: list_all_items with query='{query}', visual={visual}")
     
-    # If query is a generic "all" or similar, search for everything
-    search_q = "" if query.lower() in ["all", "everything", "current", "items"] else query
-    items = db.search_items(search_q) 
-    
+    # If query is a generic "all" or similar, list everything a page at a time
+    if query.lower() in ["all", "everything", "current", "items"]:
+        total = db.count_items()
+        if total == 0:
+            return "There are no items currently stored in the database."
+        first_page, _ = db.get_items_page(Config.ITEM_PAGE_SIZE)
+        return _launch_viewer(first_page, "all items", total=total)
+
+    items = db.search_items(query, limit=Config.ITEM_PAGE_SIZE)
     if not items:
-        if search_q:
-            return f"No items found matching '{search_q}'."
-        return "There are no items currently stored in the database."
+        return f"No items found matching '{query}'."
     
     # Always launch viewer for this tool as per user request
-    return _launch_viewer(items, query if search_q else "all items")
+    return _launch_viewer(items, query)
 
 # --- Factory ---
 
-def get_tools(frame_request_queue: Queue, frame_response_queue: Queue) -> list:
+def get_tools(
+    frame_snapshot: Callable[[], Optional[FrameSnapshot]],
+    item_writer: ItemWriter,
+    open_sessions: Callable[[], List[Session]]
+) -> list:
     """
     Returns the list of tools for the agent.
-    Injects dependencies (queues, db) into the functions.
+    Injects dependencies (frame snapshot, db, item writer, visitor history and
+    the visits still in progress) into the functions.
     """
     # Initialize DB (singleton-ish for this session)
     db = ItemDatabase(Config.DB_PATH)
+    history = VisitorHistory(Config.VISITOR_DB_PATH)
 
     return [
-        Tool(
+        StructuredTool.from_function(
+            func=partial(get_visitor_log, history=history, open_sessions=open_sessions),
             name="GetVisitorLog",
-            func=get_visitor_log,
-            description="Answer questions about who visited the room and when based on logs.",
+            description="Answer questions about who visited the room and when. Pick an aggregation and narrow it "
+                        "with a date range and/or person; results are already summarized.",
+            args_schema=VisitorLogInput,
         ),
         StructuredTool.from_function(
             func=partial(list_all_items, db=db),
@@ -188,9 +373,8 @@ def get_tools(frame_request_queue: Queue, frame_response_queue: Queue) -> list:
         StructuredTool.from_function(
             func=partial(
                 store_item_location_structured,
-                frame_request_queue=frame_request_queue,
-                frame_response_queue=frame_response_queue,
-                db=db
+                frame_snapshot=frame_snapshot,
+                writer=item_writer
             ),
             name="StoreItemLocation",
             description="Use this when the user wants to store or save the location of an item. Extract item_name and place_name.",
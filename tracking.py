@@ -0,0 +1,214 @@
+import cv2
+import time
+import itertools
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+from logger import logger
+
+
+def iou(box_a: np.ndarray, box_b: np.ndarray) -> float:
+    """Intersection-over-union of two (x1, y1, x2, y2) boxes."""
+    x1 = max(box_a[0], box_b[0])
+    y1 = max(box_a[1], box_b[1])
+    x2 = min(box_a[2], box_b[2])
+    y2 = min(box_a[3], box_b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    area_a = max(0.0, box_a[2] - box_a[0]) * max(0.0, box_a[3] - box_a[1])
+    area_b = max(0.0, box_b[2] - box_b[0]) * max(0.0, box_b[3] - box_b[1])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """
+    A face followed across frames. Holds the box (compatible with draw_box,
+    which only reads `.bbox`) and the identity cached from recognize_face.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, bbox: np.ndarray, name: str, sim: float):
+        self.track_id = next(Track._ids)
+        self.bbox = np.asarray(bbox, dtype=np.float32).copy()
+        self.name = name
+        self.sim = sim
+        self.points: Optional[np.ndarray] = None
+        self.age = 0
+        self.verified_at = time.monotonic()
+
+    def __repr__(self):
+        return f"Track({self.track_id}, {self.name}, {self.sim:.2f})"
+
+
+class FaceTracker:
+    """
+    Propagates face boxes between full detections with sparse Lucas-Kanade
+    optical flow and associates new detections to existing tracks by IoU.
+    Full detection is requested every `detect_interval` frames, or
+    immediately when a track can no longer be followed.
+
+    Identities are cached per track: once a track is confidently recognized
+    its embedding is not recomputed until `reverify_sec` has elapsed.
+    """
+    def __init__(
+        self,
+        detect_interval: int = 5,
+        iou_threshold: float = 0.3,
+        min_points: int = 5,
+        max_corners: int = 30,
+        confirm_threshold: float = 0.55,
+        reverify_sec: float = 10.0
+    ):
+        self.detect_interval = max(1, detect_interval)
+        self.confirm_threshold = confirm_threshold
+        self.reverify_sec = reverify_sec
+        self.iou_threshold = iou_threshold
+        self.min_points = min_points
+        self.max_corners = max_corners
+        self.tracks: List[Track] = []
+        self.frames_since_detection = 0
+        self.track_lost = False
+        self._prev_gray: Optional[np.ndarray] = None
+
+        # Stats
+        self.detections_run = 0
+        self.frames_tracked = 0
+        self.embeddings_computed = 0
+        self.embeddings_saved = 0
+
+    def should_detect(self) -> bool:
+        """True when the next frame needs the full detection pipeline."""
+        return (
+            self._prev_gray is None
+            or self.track_lost
+            or self.frames_since_detection >= self.detect_interval - 1
+        )
+
+    def associate(self, bboxes: Sequence[np.ndarray]) -> List[Optional[Track]]:
+        """
+        Greedily matches each detected box to the existing track it overlaps
+        most (above iou_threshold). Returns the matched track or None per box.
+        """
+        unmatched = list(self.tracks)
+        matched = []
+        for bbox in bboxes:
+            best, best_iou = None, self.iou_threshold
+            for track in unmatched:
+                overlap = iou(track.bbox, bbox)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is not None:
+                unmatched.remove(best)
+            matched.append(best)
+        return matched
+
+    def needs_embedding(self, track: Optional[Track]) -> bool:
+        """
+        True for new tracks, tracks without a confident identity, and
+        confirmed tracks that are due for periodic re-verification.
+        """
+        if track is None:
+            return True
+        if track.name == "Unknown" or track.sim < self.confirm_threshold:
+            return True
+        return time.monotonic() - track.verified_at >= self.reverify_sec
+
+    def record_embeddings(self, computed: int, saved: int):
+        self.embeddings_computed += computed
+        self.embeddings_saved += saved
+
+    def update(
+        self,
+        gray: np.ndarray,
+        detections: Sequence[Tuple[np.ndarray, str, float]],
+        matched: Optional[Sequence[Optional[Track]]] = None,
+        verified: Optional[Sequence[bool]] = None
+    ) -> List[Track]:
+        """
+        Replaces the track set with fresh detections (bbox, name, sim),
+        keeping track ids for detections that overlap an existing track.
+        `matched` can pass in the result of a prior associate() call and
+        `verified` marks which detections carry a freshly computed identity
+        (all of them by default).
+        """
+        if matched is None:
+            matched = self.associate([bbox for bbox, _, _ in detections])
+        if verified is None:
+            verified = [True] * len(detections)
+
+        now = time.monotonic()
+        new_tracks = []
+        for (bbox, name, sim), track, fresh in zip(detections, matched, verified):
+            if track is None:
+                track = Track(bbox, name, sim)
+            else:
+                track.bbox = np.asarray(bbox, dtype=np.float32).copy()
+                track.age += 1
+                if fresh:
+                    track.name, track.sim = name, sim
+                    track.verified_at = now
+            track.points = self._seed_points(gray, track.bbox)
+            new_tracks.append(track)
+
+        self.tracks = new_tracks
+        self._prev_gray = gray
+        self.frames_since_detection = 0
+        self.track_lost = False
+        self.detections_run += 1
+        return self.tracks
+
+    def propagate(self, gray: np.ndarray) -> List[Track]:
+        """
+        Moves every track by the median optical flow of its feature points.
+        Tracks that lose too many points are dropped and flag a re-detection.
+        """
+        self.frames_since_detection += 1
+        self.frames_tracked += 1
+        if self._prev_gray is None or not self.tracks:
+            self._prev_gray = gray
+            return self.tracks
+
+        alive = []
+        for track in self.tracks:
+            if track.points is None or len(track.points) < self.min_points:
+                self.track_lost = True
+                continue
+
+            new_points, status, _ = cv2.calcOpticalFlowPyrLK(
+                self._prev_gray, gray, track.points, None,
+                winSize=(15, 15), maxLevel=2
+            )
+            if new_points is None:
+                self.track_lost = True
+                continue
+
+            good = status.ravel() == 1
+            if good.sum() < self.min_points:
+                logger.debug(f"Lost {track} after {self.frames_since_detection} frames")
+                self.track_lost = True
+                continue
+
+            shift = np.median(new_points[good] - track.points[good], axis=0).ravel()
+            track.bbox[[0, 2]] += shift[0]
+            track.bbox[[1, 3]] += shift[1]
+            track.points = new_points[good].reshape(-1, 1, 2)
+            track.age += 1
+            alive.append(track)
+
+        self.tracks = alive
+        self._prev_gray = gray
+        return self.tracks
+
+    def _seed_points(self, gray: np.ndarray, bbox: np.ndarray) -> Optional[np.ndarray]:
+        h, w = gray.shape[:2]
+        x1, y1, x2, y2 = bbox.astype(int)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 <= x1 or y2 <= y1:
+            return None
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        return cv2.goodFeaturesToTrack(
+            gray, maxCorners=self.max_corners, qualityLevel=0.01,
+            minDistance=5, mask=mask
+        )
@@ -0,0 +1,310 @@
+import os
+import time
+import argparse
+import threading
+import numpy as np
+from pathlib import Path
+from typing import List, Optional
+
+from config import Config
+from logger import logger
+from gallery import EMBEDDING_DIM, FaceGallery, select_templates
+
+PROVISIONAL_PREFIX = "unknown-"
+
+
+class UnknownFaceStore:
+    """
+    Online clustering of embeddings that did not match the gallery, so a
+    recurring stranger gets a stable provisional ID (unknown-17) that the
+    visitor log can track like a name.
+
+    Centroids live in one preallocated (capacity x D) matrix and a batch of
+    embeddings is assigned with a single matrix multiply. A few sample
+    embeddings are kept per cluster so it can later be promoted to a named
+    gallery identity without new photos. Memory is bounded: clusters unseen
+    for `max_age_sec` expire, and when full the least recently seen one is
+    evicted.
+    """
+    def __init__(
+        self,
+        capacity: int = 500,
+        threshold: float = 0.5,
+        max_age_sec: float = 7 * 24 * 3600,
+        samples_per_cluster: int = 10,
+        dim: int = EMBEDDING_DIM
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.max_age_sec = max_age_sec
+        self.samples_per_cluster = samples_per_cluster
+
+        self.centroids = np.zeros((capacity, dim), dtype=np.float32)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity)  # Wall clock, so ages survive restarts
+        self.samples = np.zeros((capacity, samples_per_cluster, dim), dtype=np.float32)
+        self.next_id = 1
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self.version = 0         # Bumped on every change, so unchanged stores aren't rewritten
+        self._saved_version = 0
+
+        # Stats
+        self.clusters_created = 0
+        self.clusters_evicted = 0
+
+    def __len__(self) -> int:
+        return int(self.active.sum())
+
+    @staticmethod
+    def is_provisional(name: str) -> bool:
+        return name.startswith(PROVISIONAL_PREFIX)
+
+    def _slot(self, provisional_id: str) -> Optional[int]:
+        if not self.is_provisional(provisional_id):
+            return None
+        try:
+            number = int(provisional_id[len(PROVISIONAL_PREFIX):])
+        except ValueError:
+            return None
+        slots = np.flatnonzero(self.active & (self.ids == number))
+        return int(slots[0]) if len(slots) else None
+
+    def _expire(self, now: float):
+        expired = self.active & (now - self.last_seen > self.max_age_sec)
+        if expired.any():
+            self.active[expired] = False
+            self.clusters_evicted += int(expired.sum())
+            self.version += 1
+
+    def _new_cluster(self, embedding: np.ndarray, now: float) -> int:
+        free = np.flatnonzero(~self.active)
+        if len(free):
+            slot = int(free[0])
+        else:
+            # Full: evict the least recently seen cluster
+            slot = int(np.argmin(self.last_seen))
+            self.clusters_evicted += 1
+        self.centroids[slot] = embedding
+        self.active[slot] = True
+        self.ids[slot] = self.next_id
+        self.counts[slot] = 0
+        self.last_seen[slot] = now
+        self.next_id += 1
+        self.clusters_created += 1
+        return slot
+
+    def _add(self, slot: int, embedding: np.ndarray, now: float):
+        """Running mean of the cluster (renormalized) plus a reservoir of samples."""
+        n = self.counts[slot]
+        if n < self.samples_per_cluster:
+            self.samples[slot, n] = embedding
+        else:
+            j = np.random.randint(n + 1)
+            if j < self.samples_per_cluster:
+                self.samples[slot, j] = embedding
+        centroid = self.centroids[slot] * n + embedding
+        self.centroids[slot] = centroid / np.linalg.norm(centroid)
+        self.counts[slot] = n + 1
+        self.last_seen[slot] = now
+
+    def assign(self, embeddings: np.ndarray) -> List[str]:
+        """
+        Returns a provisional ID per (M x D) unmatched embedding, creating
+        clusters for faces not close to any existing one.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        if len(embeddings) == 0:
+            return []
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            # (M x D) @ (D x capacity); inactive slots are masked out
+            sims = embeddings @ self.centroids.T
+            sims[:, ~self.active] = -1.0
+            best = np.argmax(sims, axis=1)
+            best_sims = sims[np.arange(len(embeddings)), best]
+
+            original_ids = self.ids.copy()
+            created = []
+            ids = []
+            for embedding, slot, sim in zip(embeddings, best, best_sims):
+                # A slot recycled earlier in this batch no longer holds the cluster it was scored against
+                if sim < self.threshold or self.ids[slot] != original_ids[slot]:
+                    slot = None
+                    if created:
+                        # Faces of the same new person within one batch share a cluster
+                        created_sims = self.centroids[created] @ embedding
+                        if created_sims.max() >= self.threshold:
+                            slot = created[int(np.argmax(created_sims))]
+                    if slot is None:
+                        slot = self._new_cluster(embedding, now)
+                        created.append(slot)
+                self._add(slot, embedding, now)
+                ids.append(f"{PROVISIONAL_PREFIX}{self.ids[slot]}")
+            self.version += 1
+            return ids
+
+    def promote(self, provisional_id: str, name: str, directory: Path = Config.EMBEDDINGS_DIR,
+                max_templates: int = Config.FACE_MAX_TEMPLATES) -> FaceGallery:
+        """
+        Adds the cluster's samples to the gallery in `directory` as `name`
+        and drops the cluster. Returns the saved gallery; running agents pick
+        it up through the gallery watcher.
+        """
+        with self._lock:
+            slot = self._slot(provisional_id)
+            if slot is None:
+                raise KeyError(f"No such provisional identity: {provisional_id}")
+            samples = self.samples[slot, :min(self.counts[slot], self.samples_per_cluster)].copy()
+            self.active[slot] = False
+            self.version += 1
+
+        gallery = FaceGallery.load(directory, mmap=False) or FaceGallery.empty()
+        gallery = gallery.add_identity(
+            name,
+            select_templates(samples, max_templates),
+            {"promoted_from": provisional_id, "photos": len(samples), "enrolled_at": time.time()},
+        )
+        gallery.save(directory)
+        logger.info(f"Promoted {provisional_id} to '{name}' ({len(samples)} samples)")
+        return gallery
+
+    def forget_promoted(self, gallery: FaceGallery):
+        """Drops clusters that a gallery identity was promoted from (e.g. by the CLI)."""
+        with self._lock:
+            for meta in gallery.metadata:
+                slot = self._slot(str(meta.get("promoted_from", "")))
+                if slot is not None:
+                    self.active[slot] = False
+                    self.version += 1
+
+    def summary(self) -> List[dict]:
+        with self._lock:
+            slots = np.flatnonzero(self.active)
+            return [
+                {
+                    "id": f"{PROVISIONAL_PREFIX}{self.ids[s]}",
+                    "sightings": int(self.counts[s]),
+                    "last_seen": float(self.last_seen[s]),
+                }
+                for s in slots[np.argsort(-self.last_seen[slots])]
+            ]
+
+    # --- Persistence ---
+
+    def save(self, path: Path):
+        """
+        Persists active clusters so provisional IDs stay stable across
+        restarts. The arrays are copied under the lock and written outside
+        it (atomically, via a temporary file), so assign() is never held up
+        by the disk.
+        """
+        with self._save_lock:
+            with self._lock:
+                slots = np.flatnonzero(self.active)
+                version = self.version
+                data = dict(
+                    next_id=np.int64(self.next_id),
+                    centroids=self.centroids[slots],
+                    ids=self.ids[slots],
+                    counts=self.counts[slots],
+                    last_seen=self.last_seen[slots],
+                    samples=self.samples[slots],
+                )
+            tmp = Path(str(path) + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **data)
+            os.replace(tmp, path)
+            self._saved_version = version
+
+    def save_if_changed(self, path: Path) -> bool:
+        """Saves only if anything changed since the last save; returns whether it did."""
+        if self.version == self._saved_version:
+            return False
+        self.save(path)
+        return True
+
+    @classmethod
+    def load(cls, path: Path, **kwargs) -> "UnknownFaceStore":
+        store = cls(**kwargs)
+        if not Path(path).exists():
+            return store
+        try:
+            with np.load(str(path)) as data:
+                n = min(len(data["ids"]), store.capacity)
+                keep = np.argsort(-data["last_seen"])[:n]  # Most recent first if capacity shrank
+                k = min(data["samples"].shape[1], store.samples_per_cluster)
+                store.centroids[:n] = data["centroids"][keep]
+                store.ids[:n] = data["ids"][keep]
+                store.counts[:n] = data["counts"][keep]
+                store.last_seen[:n] = data["last_seen"][keep]
+                store.samples[:n, :k] = data["samples"][keep, :k]
+                store.active[:n] = True
+                store.next_id = int(data["next_id"])
+            logger.info(f"Loaded {n} provisional identities from {path}")
+        except Exception as e:
+            logger.error(f"Failed to load unknown face store {path}: {e}")
+        return store
+
+
+class UnknownStoreSaver(threading.Thread):
+    """
+    Saves the unknown face store every `interval` seconds while it changes,
+    so the CLI sees provisional IDs from the running agent and a crash
+    loses at most one interval of clustering.
+    """
+    def __init__(self, store: UnknownFaceStore, path: Path, interval: float = 30.0):
+        super().__init__(daemon=True, name="UnknownStoreSaver")
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.store.save_if_changed(self.path)
+            except Exception as e:
+                logger.error(f"Failed to save unknown face store: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def build_unknown_store() -> Optional[UnknownFaceStore]:
+    """The store configured in Config (loaded from disk), or None when disabled."""
+    if not Config.UNKNOWN_CLUSTERING_ENABLED:
+        return None
+    return UnknownFaceStore.load(
+        Config.UNKNOWN_STORE_PATH,
+        capacity=Config.UNKNOWN_MAX_CLUSTERS,
+        threshold=Config.UNKNOWN_MATCH_THRESHOLD,
+        max_age_sec=Config.UNKNOWN_MAX_AGE_SEC,
+        samples_per_cluster=Config.UNKNOWN_SAMPLES_PER_CLUSTER,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or promote provisional unknown identities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List provisional identities, most recently seen first")
+    promote = sub.add_parser("promote", help="Enroll a provisional identity under a name")
+    promote.add_argument("provisional_id")
+    promote.add_argument("name")
+    args = parser.parse_args()
+
+    store = build_unknown_store() or UnknownFaceStore.load(Config.UNKNOWN_STORE_PATH)
+    if args.command == "list":
+        for entry in store.summary():
+            seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["last_seen"]))
+            print(f"{entry['id']:<14} sightings={entry['sightings']:<6} last_seen={seen}")
+    else:
+        store.promote(args.provisional_id, args.name)
+        store.save(Config.UNKNOWN_STORE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,179 @@
 
-import json
-from datetime import datetime
-from typing import Dict, List, Any
+import time
+import heapq
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
 from logger import logger
 from config import Config
+from visitor_history import Session, VisitorHistory
+from batch_writer import BatchWriterThread
 
-def log_visitor_session(name: str, arrived_at: datetime, left_at: datetime, logfile: str) -> None:
+class VisitorLogWriter(BatchWriterThread):
     """
-    Log a visitor session as a JSON object per line.
+    Records visitor sessions in the visitor history database from a
+    background thread, so a slow or stalled disk never blocks the video
+    threads. Sessions go onto a bounded queue; the writer drains up to
+    `batch_size` of them (waiting at most `batch_sec` after the first) and
+    inserts them in one transaction.
+
+    fsync policy: "batch" syncs every transaction, "interval" lets SQLite's
+    WAL defer syncing and forces a checkpoint every `fsync_sec`, "never"
+    leaves it to the OS. Even with "batch", sessions still in the queue are
+    lost on a crash: normally less than one batch, but up to `queue_size`
+    if the disk stalls. When the queue is full, log_session drops the
+    session and counts it rather than block; queue depth, its high-water
+    mark and drops are reported by stats().
     """
-    try:
-        record = {
-            "Timestamp": arrived_at.strftime("%Y-%m-%d"),
-            "visitor": name,
-            "from": arrived_at.strftime("%H:%M:%S"),
-            "to": left_at.strftime("%H:%M:%S"),
+    SYNCHRONOUS_BY_POLICY = {"batch": "FULL", "interval": "NORMAL", "never": "OFF"}
+
+    def __init__(
+        self,
+        db_path: Path,
+        queue_size: int = 1000,
+        batch_size: int = 50,
+        batch_sec: float = 1.0,
+        fsync: str = "batch",
+        fsync_sec: float = 5.0
+    ):
+        super().__init__("VisitorLogWriter", queue_size, batch_size, batch_sec)
+        if fsync not in self.SYNCHRONOUS_BY_POLICY:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.history = VisitorHistory(db_path, synchronous=self.SYNCHRONOUS_BY_POLICY[fsync])
+        self.fsync = fsync
+        self.fsync_sec = fsync_sec
+        self._last_fsync = time.monotonic()
+
+        # Stats
+        self.records_written = 0
+        self.batches_written = 0
+        self.records_dropped = 0
+        self.max_write_sec = 0.0
+
+    def log_session(self, name: str, arrived_at: datetime, left_at: datetime):
+        """Queues a session without blocking; PresenceTracker's on_session callback."""
+        if self.enqueue((name, arrived_at, left_at)):
+            return
+        self.records_dropped += 1
+        if self.records_dropped == 1 or self.records_dropped % 100 == 0:
+            logger.warning(
+                f"Visitor log writer is falling behind: queue full, "
+                f"{self.records_dropped} sessions dropped so far"
+            )
+
+    def write_batch(self, batch: List[Session]):
+        start = time.monotonic()
+        self.history.add_sessions(batch)
+        if self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_sec:
+            self.history.checkpoint()
+            self._last_fsync = time.monotonic()
+        self.max_write_sec = max(self.max_write_sec, time.monotonic() - start)
+        self.records_written += len(batch)
+        self.batches_written += 1
+        logger.debug(f"Logged {len(batch)} visitor sessions")
+
+    def on_stop(self):
+        if self.fsync != "never":
+            try:
+                self.history.checkpoint()
+            except Exception as e:
+                logger.error(f"Failed to checkpoint visitor history: {e}")
+        self.history.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queued": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "written": self.records_written,
+            "batches": self.batches_written,
+            "dropped": self.records_dropped,
+            "max_write_ms": self.max_write_sec * 1000,
         }
-        with open(logfile, "a") as f:
-            f.write(json.dumps(record) + "\n")
-        logger.info(f"Logged session for visitor: {name}")
-    except Exception as e:
-        logger.error(f"Failed to log visitor session: {e}", exc_info=True)
-
-
-def update_visitors(
-    detected_names: List[str], 
-    active_visitors: Dict[str, Any], 
-    logfile: str, 
-    grace_period_sec: int
-) -> Dict[str, Any]:
+
+
+@dataclass
+class Visit:
+    arrived_at: datetime   # Wall clock, for the log only
+    arrived_mono: float
+    last_seen: float       # Monotonic
+
+
+class PresenceTracker:
     """
-    Update visitor status based on detected names.
-    Log arrivals and departures.
+    Turns per-frame name sets into visitor sessions. Seeing a name is an
+    arrival event (new visitor) or just refreshes last_seen; departures are
+    scheduled on a heap keyed by last_seen + grace period instead of
+    rescanning every active visitor each frame. Heap entries are checked
+    lazily: one whose visitor was seen again is pushed back with the new
+    deadline. Per-frame cost is O(faces in frame) plus O(log n) per due entry.
+
+    Names reported by several cameras simply refresh the same visit, so a
+    person seen by two doors is one visitor.
     """
-    now = datetime.now()
-
-    # Handle arrivals
-    for name in detected_names:
-        if name == "Unknown":
-            continue
-            
-        if name not in active_visitors:
-            # First time seeing this visitor
-            active_visitors[name] = {"last_seen": now, "arrived_at": now}
-            logger.info(f"New visitor detected: {name}")
-        else:
-            active_visitors[name]["last_seen"] = now
-
-    # Handle departures
-    to_remove = []
-    for name, data in active_visitors.items():
-        if name not in detected_names:
-            # Person is no longer detected -> check if departed
-            time_absent = (now - data["last_seen"]).total_seconds()
-            
-            if time_absent > grace_period_sec:
-                logger.info(f"Visitor {name} considered departed (absent for {time_absent:.1f}s)")
-                log_visitor_session(
-                    name, data["arrived_at"], data["last_seen"], logfile
-                )
-                to_remove.append(name)
-
-    for name in to_remove:
-        del active_visitors[name]
-
-    return active_visitors
+    def __init__(
+        self,
+        grace_period_sec: float,
+        on_session: Callable[[str, datetime, datetime], None],
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.grace_period_sec = grace_period_sec
+        self.on_session = on_session
+        self.clock = clock
+        self.active: Dict[str, Visit] = {}
+        self._departures: List[Tuple[float, str]] = []  # (deadline, name) min-heap
+        self._lock = threading.Lock()
+
+    def observe(self, names: Iterable[str]):
+        """Records the names detected in a frame and processes due departures."""
+        now = self.clock()
+        with self._lock:
+            for name in set(names):
+                if name == "Unknown":
+                    continue
+                visit = self.active.get(name)
+                if visit is None:
+                    self.active[name] = Visit(datetime.now(), now, now)
+                    heapq.heappush(self._departures, (now + self.grace_period_sec, name))
+                    logger.info(f"New visitor detected: {name}")
+                else:
+                    visit.last_seen = now
+            self._depart_due(now)
+
+    def tick(self):
+        """Processes departures that fell due while no frames were reported."""
+        with self._lock:
+            self._depart_due(self.clock())
+
+    def _depart_due(self, now: float):
+        while self._departures and self._departures[0][0] <= now:
+            _, name = heapq.heappop(self._departures)
+            visit = self.active.get(name)
+            if visit is None:
+                continue
+            deadline = visit.last_seen + self.grace_period_sec
+            if deadline > now:
+                # Seen again since this entry was scheduled
+                heapq.heappush(self._departures, (deadline, name))
+                continue
+            logger.info(f"Visitor {name} considered departed (absent for {now - visit.last_seen:.1f}s)")
+            self._end(name, visit)
+
+    def _end(self, name: str, visit: Visit):
+        del self.active[name]
+        left_at = visit.arrived_at + timedelta(seconds=visit.last_seen - visit.arrived_mono)
+        self.on_session(name, visit.arrived_at, left_at)
+
+    def open_sessions(self) -> List[Session]:
+        """Visits still in progress as (name, arrived_at, now); they reach the history only on departure."""
+        now = datetime.now()
+        with self._lock:
+            return [(name, visit.arrived_at, now) for name, visit in self.active.items()]
+
+    def flush(self):
+        """Ends and logs every open session (on shutdown), as of when each visitor was last seen."""
+        with self._lock:
+            for name, visit in list(self.active.items()):
+                self._end(name, visit)
+            self._departures.clear()
@@ -3,11 +3,15 @@ import os
 import sqlite3
 import numpy as np
 import time
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from typing import Dict, Tuple, Any
 
 from config import Config
 from logger import logger
+from gallery import FaceGallery
+from gallery_index import attach_index
 
 def load_known_faces(embeddings_folder: Path) -> Dict[str, np.ndarray]:
     """
@@ -22,7 +26,7 @@ def load_known_faces(embeddings_folder: Path) -> Dict[str, np.ndarray]:
         try:
             # Extract name from filename
             name = file_path.stem.replace("_embedding", "")
-            # Load embedding
+            # Load embedding: (D,) single template or (K x D) templates
             embedding = np.load(str(file_path))
             known_faces[name] = embedding
             logger.debug(f"Loaded face embedding for: {name}")
@@ -33,6 +37,31 @@ def load_known_faces(embeddings_folder: Path) -> Dict[str, np.ndarray]:
     return known_faces
 
 
+def load_gallery(embeddings_folder: Path) -> FaceGallery:
+    """
+    Loads the consolidated, memory-mapped gallery with its configured search
+    index. Legacy per-person *_embedding.npy files are consolidated into
+    that format on first use (only when there is no gallery index yet).
+    """
+    try:
+        gallery = FaceGallery.load(embeddings_folder)
+    except Exception as e:
+        # Don't overwrite a damaged gallery with the (possibly stale) legacy files
+        logger.error(f"Failed to load gallery index, falling back to embedding files: {e}")
+        return attach_index(FaceGallery.from_dict(load_known_faces(embeddings_folder)), embeddings_folder)
+    if gallery is not None:
+        logger.info(f"Loaded gallery with {len(gallery)} identities.")
+        return attach_index(gallery, embeddings_folder)
+
+    gallery = FaceGallery.from_dict(load_known_faces(embeddings_folder))
+    if len(gallery):
+        try:
+            gallery.save(embeddings_folder)
+        except Exception as e:
+            logger.error(f"Failed to consolidate gallery: {e}")
+    return attach_index(gallery, embeddings_folder)
+
+
 def init_item_db(db_path: Path = Config.DB_PATH) -> None:
     """
     Initializes the SQLite database for item logging.
@@ -66,3 +95,35 @@ def compute_latency(start_time: float, end_time: float, task: str = "", precisio
     latency = round(end_time - start_time, precision)
     logger.info(f"{task} Latency: {latency} seconds")
     return latency
+
+
+class StageTimer:
+    """
+    Thread-safe accumulator of per-stage wall-clock timings, used to report
+    where each frame's time goes (capture, detection, embedding, ...).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._totals[stage] = self._totals.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + 1
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Tuple[int, float, float]]:
+        """Returns {stage: (calls, total_sec, mean_ms)}."""
+        with self._lock:
+            return {
+                stage: (count, self._totals[stage], self._totals[stage] * 1000 / count)
+                for stage, count in self._counts.items()
+            }
@@ -22,55 +22,42 @@ def create_info_image(text: str, bg_color=(0, 0, 0)):
     cv2.putText(img, controls, (50, 400), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (200, 200, 200), 1)
     return img
 
+def iter_requested_items(db: ItemDatabase, item_ids):
+    """Yields (id, item_name, place_name, timestamp, image_path) for each ID still in the database."""
+    for item_id in item_ids:
+        # Fetched when reached, in case it was deleted in the meantime
+        item = db.get_item(item_id)
+        if item:
+            yield item
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--ids", nargs="+", type=int, help="List of Item IDs to view")
+    parser.add_argument("--all", action="store_true", help="Page through every stored item, newest first")
     args = parser.parse_args()
 
-    if not args.ids:
+    if not args.ids and not args.all:
         print("No IDs provided.")
         return
 
     db = ItemDatabase(Config.DB_PATH)
-    items_to_view = args.ids
+    if args.all:
+        # Loaded a page at a time as the user steps through, not all up front
+        items = db.iter_items(page_size=Config.ITEM_PAGE_SIZE)
+        print("Starting viewer for all items")
+    else:
+        items = iter_requested_items(db, args.ids)
+        print(f"Starting viewer for IDs: {args.ids}")
     
     deleted_count = 0
-    i = 0
-    
-    print(f"Starting viewer for IDs: {items_to_view}")
 
     # Create window
     window_name = "Item Viewer - Video Agent"
     cv2.namedWindow(window_name)
     cv2.moveWindow(window_name, 100, 100) # Attempt to position on screen
 
-    while i < len(items_to_view):
-        item_id = items_to_view[i]
-        
-        # Fetch current details (in case it was deleted externally, or to verify)
+    for item_id, name, place, timestamp, image_path in items:
         try:
-            # We need to fetch details. The DB class doesn't have "get_by_id".
-            # Let's just do a quick manual query or rely on "search" logic?
-            # Or add get_by_id to DB? 
-            # For now, let's just assume we need to execute a query.
-            # But wait, `view_items.py` imports `ItemDatabase`.
-            # I can add a helper or just run raw SQL here since it's a helper script.
-            # Actually, reusing `find_item` is hard if we only have ID.
-            # Let's stick to the DB connection for simplicity.
-            
-            import sqlite3
-            with sqlite3.connect(Config.DB_PATH) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT item_name, place_name, timestamp, image_path FROM item_log WHERE id = ?", (item_id,))
-                result = cursor.fetchone()
-            
-            if not result:
-                # Item might have been deleted
-                i += 1
-                continue
-
-            name, place, timestamp, image_path = result
-            
             # Load Image
             img = cv2.imread(image_path)
             if img is None:
@@ -90,13 +77,15 @@ def main():
 
             cv2.imshow(window_name, img)
             
-            # Wait for key
+            # Wait for key (anything other than n/d/q keeps showing this item)
             key = cv2.waitKey(0) & 0xFF
+            while key not in (ord('n'), ord('d'), ord('q')):
+                key = cv2.waitKey(0) & 0xFF
             
             if key == ord('q'):
                 break
             elif key == ord('n'):
-                i += 1
+                continue
             elif key == ord('d'):
                 # Delete
                 if db.delete_item(item_id):
@@ -109,13 +98,11 @@ def main():
                     
                     cv2.imshow(window_name, img)
                     cv2.waitKey(800) # Show for 0.8s
-                i += 1
                 
         except KeyboardInterrupt:
             break
         except Exception as e:
             print(f"Error viewing item {item_id}: {e}")
-            i += 1
 
     cv2.destroyAllWindows()
     # cv2.waitKey(1)
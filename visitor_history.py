@@ -0,0 +1,277 @@
+import json
+import sqlite3
+import argparse
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+from config import Config
+from logger import logger
+from database import SQLiteConnections
+
+Session = Tuple[str, datetime, datetime]  # (visitor, arrived_at, left_at)
+DateLike = Union[date, datetime, str]
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _day(value: DateLike) -> str:
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+class VisitorHistory:
+    """
+    Visitor sessions in SQLite, indexed by visitor and by date so that
+    range and per-person queries stay fast however long the history gets.
+    Times are stored as local 'YYYY-MM-DD HH:MM:SS' text, which sorts
+    chronologically.
+    """
+    SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL")
+
+    def __init__(self, db_path: Path, synchronous: str = "FULL"):
+        if synchronous not in self.SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode: {synchronous}")
+        self.db_path = db_path
+        self.synchronous = synchronous
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.connections = SQLiteConnections(db_path, {"synchronous": synchronous})
+        self._initialize_db()
+
+    def close(self):
+        self.connections.close_all()
+
+    def _initialize_db(self):
+        """Creates the tables and indexes if they don't exist."""
+        try:
+            with self.connections.get() as conn:
+                conn.executescript("""
+                    CREATE TABLE IF NOT EXISTS visits (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        visitor TEXT NOT NULL,
+                        date TEXT NOT NULL,
+                        arrived_at TEXT NOT NULL,
+                        left_at TEXT NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_visits_visitor ON visits (visitor, arrived_at);
+                    CREATE INDEX IF NOT EXISTS idx_visits_date ON visits (date, arrived_at);
+                    CREATE INDEX IF NOT EXISTS idx_visits_visitor_nocase ON visits (visitor COLLATE NOCASE);
+                    -- Running totals for raw_log_size, kept by triggers so it never scans visits
+                    CREATE TABLE IF NOT EXISTS visit_totals (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        sessions INTEGER NOT NULL,
+                        name_chars INTEGER NOT NULL
+                    );
+                    INSERT OR IGNORE INTO visit_totals (id, sessions, name_chars)
+                        SELECT 1, COUNT(*), COALESCE(SUM(LENGTH(visitor)), 0) FROM visits
+                        WHERE NOT EXISTS (SELECT 1 FROM visit_totals);
+                    CREATE TRIGGER IF NOT EXISTS visits_totals_ai AFTER INSERT ON visits BEGIN
+                        UPDATE visit_totals SET sessions = sessions + 1, name_chars = name_chars + LENGTH(new.visitor);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS visits_totals_ad AFTER DELETE ON visits BEGIN
+                        UPDATE visit_totals SET sessions = sessions - 1, name_chars = name_chars - LENGTH(old.visitor);
+                    END;
+                    CREATE TABLE IF NOT EXISTS migrations (
+                        source TEXT PRIMARY KEY,
+                        rows INTEGER,
+                        imported_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+            logger.info(f"Initialized visitor history at {self.db_path}")
+        except Exception as e:
+            logger.error(f"Failed to initialize visitor history: {e}")
+
+    # --- Writes ---
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, sessions: Iterable[Session]) -> int:
+        rows = [
+            (name, arrived.strftime("%Y-%m-%d"), arrived.strftime(TIME_FORMAT), left.strftime(TIME_FORMAT))
+            for name, arrived, left in sessions
+        ]
+        conn.executemany("INSERT INTO visits (visitor, date, arrived_at, left_at) VALUES (?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def add_sessions(self, sessions: Iterable[Session]) -> int:
+        """Inserts sessions in one transaction; returns the number inserted."""
+        with self.connections.get() as conn:
+            return self._insert(conn, sessions)
+
+    def checkpoint(self):
+        """Flushes the write-ahead log into the database file (and syncs it)."""
+        with self.connections.get() as conn:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    # --- Queries ---
+
+    @staticmethod
+    def _filters(start: Optional[DateLike], end: Optional[DateLike], visitor: Optional[str]) -> Tuple[str, list]:
+        conditions, params = [], []
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(_day(start))
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(_day(end))
+        if visitor is not None:
+            conditions.append("visitor = ?")
+            params.append(visitor)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def sessions(
+        self,
+        start: Optional[DateLike] = None,
+        end: Optional[DateLike] = None,
+        visitor: Optional[str] = None,
+        limit: Optional[int] = None
+    ) -> List[Tuple[str, str, str]]:
+        """
+        Sessions between the start and end dates (inclusive), optionally for
+        one visitor, newest first. Returns (visitor, arrived_at, left_at).
+        """
+        where, params = self._filters(start, end, visitor)
+        sql = f"SELECT visitor, arrived_at, left_at FROM visits {where} ORDER BY arrived_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to query visitor history: {e}")
+            return []
+
+    def first_last_seen(self, visitor: Optional[str] = None) -> List[Tuple[str, str, str, int]]:
+        """(visitor, first arrival, last departure, number of visits) per visitor."""
+        where, params = self._filters(None, None, visitor)
+        sql = f"SELECT visitor, MIN(arrived_at), MAX(left_at), COUNT(*) FROM visits {where} GROUP BY visitor ORDER BY MAX(left_at) DESC"
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to query visitor history: {e}")
+            return []
+
+    def dwell_summary(
+        self,
+        start: Optional[DateLike] = None,
+        end: Optional[DateLike] = None,
+        visitor: Optional[str] = None
+    ) -> List[Tuple[str, int, float, str, str]]:
+        """
+        (visitor, visits, total dwell seconds, first arrival, last departure)
+        per visitor in the date range, busiest first.
+        """
+        where, params = self._filters(start, end, visitor)
+        sql = f"""
+            SELECT visitor, COUNT(*),
+                   SUM((julianday(left_at) - julianday(arrived_at)) * 86400.0),
+                   MIN(arrived_at), MAX(left_at)
+            FROM visits {where}
+            GROUP BY visitor ORDER BY COUNT(*) DESC, visitor
+        """
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to summarize visitor history: {e}")
+            return []
+
+    def present_at(self, moment: datetime) -> List[Tuple[str, str, str]]:
+        """Sessions in progress at `moment`: (visitor, arrived_at, left_at)."""
+        t = moment.strftime(TIME_FORMAT)
+        # Bounded by the date index; sessions are assumed not to span more than a day
+        sql = """
+            SELECT visitor, arrived_at, left_at FROM visits
+            WHERE date BETWEEN ? AND ? AND arrived_at <= ? AND left_at >= ?
+            ORDER BY arrived_at
+        """
+        params = (_day(moment - timedelta(days=1)), _day(moment), t, t)
+        try:
+            with self.connections.get() as conn:
+                return conn.execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"Failed to query visitor history: {e}")
+            return []
+
+    def raw_log_size(self) -> Tuple[int, int]:
+        """(sessions, characters) the whole history would take as the legacy JSONL log."""
+        try:
+            with self.connections.get() as conn:
+                count, name_chars = conn.execute("SELECT sessions, name_chars FROM visit_totals").fetchone()
+        except Exception as e:
+            logger.error(f"Failed to size visitor history: {e}")
+            return 0, 0
+        # Every JSONL line is 81 characters plus the visitor's name
+        return count, count * 81 + name_chars
+
+    def find_visitor(self, name: str) -> Optional[str]:
+        """The visitor's name as stored, matched case-insensitively, or None if never seen."""
+        try:
+            with self.connections.get() as conn:
+                row = conn.execute(
+                    "SELECT visitor FROM visits WHERE visitor = ? COLLATE NOCASE LIMIT 1", (name.strip(),)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Failed to look up visitor: {e}")
+            return None
+
+    def visitors(self) -> List[str]:
+        try:
+            with self.connections.get() as conn:
+                return [row[0] for row in conn.execute("SELECT DISTINCT visitor FROM visits ORDER BY visitor")]
+        except Exception as e:
+            logger.error(f"Failed to list visitors: {e}")
+            return []
+
+    # --- Migration ---
+
+    def import_jsonl(self, log_path: Path) -> int:
+        """
+        One-shot import of a legacy visitor_log.txt (one JSON session per
+        line). A file already imported is skipped; returns rows imported.
+        """
+        log_path = Path(log_path)
+        source = str(log_path.resolve())
+        if not log_path.exists():
+            return 0
+        with self.connections.get() as conn:
+            if conn.execute("SELECT 1 FROM migrations WHERE source = ?", (source,)).fetchone():
+                return 0
+
+        sessions = []
+        with open(log_path, "r") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    arrived = datetime.strptime(f"{record['Timestamp']} {record['from']}", TIME_FORMAT)
+                    left = datetime.strptime(f"{record['Timestamp']} {record['to']}", TIME_FORMAT)
+                    if left < arrived:
+                        left += timedelta(days=1)  # Session ran past midnight
+                    sessions.append((record["visitor"], arrived, left))
+                except Exception as e:
+                    logger.warning(f"Skipping malformed visitor log line {line_no}: {e}")
+
+        with self.connections.get() as conn:
+            count = self._insert(conn, sessions)
+            conn.execute("INSERT INTO migrations (source, rows) VALUES (?, ?)", (source, count))
+        logger.info(f"Imported {count} visitor sessions from {log_path}")
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a JSONL visitor log into the visitor history database.")
+    parser.add_argument("log", type=Path, nargs="?", default=Config.VISITOR_LOG_PATH)
+    parser.add_argument("--db", type=Path, default=Config.VISITOR_DB_PATH)
+    args = parser.parse_args()
+    count = VisitorHistory(args.db).import_jsonl(args.log)
+    print(f"Imported {count} sessions into {args.db}")
+
+
+if __name__ == "__main__":
+    main()